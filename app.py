@@ -1,21 +1,190 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, session, abort, g,
+                   Response, send_file, send_from_directory, stream_with_context, has_request_context,
+                   before_render_template, template_rendered)
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
-from datetime import datetime
+from flask_sqlalchemy.session import Session as SessaoFlask
+from flask_migrate import Migrate, upgrade as migrar_banco
+from sqlalchemy import and_, or_, event, func, insert, update, select, delete, union_all, inspect, tuple_
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload, defer
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from zipfile import BadZipFile
+import csv
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import logging
+import math
+import mimetypes
 import os
+import random
+import re
+import secrets
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import click
 import requests as http_requests
+from requests.adapters import HTTPAdapter
 import mercadopago
+from mercadopago.http import HttpClient
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils.exceptions import InvalidFileException
+from PIL import Image, ImageOps, UnidentifiedImageError
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'sua-chave-secreta-aqui')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///croche_store.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # uploads (planilhas e fotos de produtos)
+
+# Fotos enviadas pelo admin: variantes por largura (JPEG + WebP) com nome derivado do conteúdo
+app.config['IMAGENS_PASTA'] = os.environ.get('IMAGENS_PASTA', os.path.join(app.instance_path, 'imagens'))
+app.config['IMAGENS_LARGURAS'] = tuple(
+    int(w) for w in os.environ.get('IMAGENS_LARGURAS', '320,640,1024').split(','))
+
+# Cache do catálogo: 'memoria' (LRU por processo) ou 'redis' (compartilhado entre workers)
+app.config['CATALOGO_CACHE_BACKEND'] = os.environ.get('CATALOGO_CACHE_BACKEND', 'memoria')
+app.config['CATALOGO_CACHE_TTL'] = int(os.environ.get('CATALOGO_CACHE_TTL', 300))
+app.config['CATALOGO_CACHE_MAX_ITENS'] = int(os.environ.get('CATALOGO_CACHE_MAX_ITENS', 512))
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', '')
 
 MERCADOPAGO_ACCESS_TOKEN = os.environ.get('MERCADOPAGO_ACCESS_TOKEN', '')
-sdk = mercadopago.SDK(MERCADOPAGO_ACCESS_TOKEN) if MERCADOPAGO_ACCESS_TOKEN else None
 
-db = SQLAlchemy(app)
+# Chamadas ao Mercado Pago: nunca podem segurar um worker por mais que alguns segundos
+app.config['MP_API_URL'] = os.environ.get('MP_API_URL', 'https://api.mercadopago.com')
+app.config['MP_TIMEOUT_CONEXAO'] = float(os.environ.get('MP_TIMEOUT_CONEXAO', 3.05))
+app.config['MP_TIMEOUT_LEITURA'] = float(os.environ.get('MP_TIMEOUT_LEITURA', 8))
+app.config['MP_PRAZO_TOTAL'] = float(os.environ.get('MP_PRAZO_TOTAL', 15))
+app.config['MP_MAX_TENTATIVAS'] = int(os.environ.get('MP_MAX_TENTATIVAS', 2))
+app.config['MP_POOL_CONEXOES'] = int(os.environ.get('MP_POOL_CONEXOES', 10))
+app.config['MP_DISJUNTOR_FALHAS'] = int(os.environ.get('MP_DISJUNTOR_FALHAS', 5))
+app.config['MP_DISJUNTOR_RESET'] = float(os.environ.get('MP_DISJUNTOR_RESET', 30))
+# Pedidos não pagos expiram (link do MP e registro) depois deste prazo — ver `expirar-pedidos`
+app.config['PEDIDOS_EXPIRAM_HORAS'] = float(os.environ.get('PEDIDOS_EXPIRAM_HORAS', 24))
+
+# Métricas e logs: /metrics (Prometheus) exige METRICS_TOKEN (Bearer) ou sessão de admin
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+app.config['LOG_REQUISICOES_JSON'] = os.environ.get('LOG_REQUISICOES_JSON', '') == '1'
+app.config['SQL_LENTA_MS'] = float(os.environ.get('SQL_LENTA_MS', 200))
+
+# Login do admin: falhas contadas por IP e por usuário numa janela deslizante; passado o limite,
+# o bloqueio dobra a cada nova falha. 'memoria' (por processo) ou 'redis' (usa CACHE_REDIS_URL)
+app.config['LOGIN_LIMITE_BACKEND'] = os.environ.get('LOGIN_LIMITE_BACKEND', 'memoria')
+app.config['LOGIN_JANELA_SEGUNDOS'] = int(os.environ.get('LOGIN_JANELA_SEGUNDOS', 900))
+app.config['LOGIN_MAX_FALHAS_IP'] = int(os.environ.get('LOGIN_MAX_FALHAS_IP', 20))
+app.config['LOGIN_MAX_FALHAS_USUARIO'] = int(os.environ.get('LOGIN_MAX_FALHAS_USUARIO', 5))
+app.config['LOGIN_BLOQUEIO_SEGUNDOS'] = float(os.environ.get('LOGIN_BLOQUEIO_SEGUNDOS', 30))
+app.config['LOGIN_BLOQUEIO_MAX_SEGUNDOS'] = float(os.environ.get('LOGIN_BLOQUEIO_MAX_SEGUNDOS', 3600))
+# Verificar senha (scrypt) custa CPU e memória: no máximo N ao mesmo tempo por processo
+app.config['LOGIN_HASHES_SIMULTANEOS'] = int(os.environ.get('LOGIN_HASHES_SIMULTANEOS', 2))
+app.config['LOGIN_ESPERA_HASH'] = float(os.environ.get('LOGIN_ESPERA_HASH', 3))
+# Método do hash das senhas (formato do werkzeug); hashes em outro formato são refeitos no login
+app.config['SENHA_METODO_HASH'] = os.environ.get('SENHA_METODO_HASH', 'scrypt')
+# Proxies reversos à frente do app (no Render, 1): sem isso todo mundo tem o IP do proxy
+app.config['PROXY_SALTOS'] = int(os.environ.get('PROXY_SALTOS', 0))
+
+# Banco: pool ajustado no PostgreSQL; WAL + busy_timeout no SQLite (ver `configurar_conexao_sqlite`)
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+# Réplica de leitura (opcional): só as rotas da vitrine marcadas com @leitura_na_replica usam
+app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL', '')
+
+if app.config['PROXY_SALTOS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_SALTOS'], x_proto=app.config['PROXY_SALTOS'])
+
+
+def opcoes_engine(url):
+    """Opções do create_engine para a URL: o pool só faz sentido fora do SQLite."""
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': app.config['DB_POOL_PRE_PING'],
+    }
+
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+if app.config['DATABASE_REPLICA_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {
+        'replica': dict(opcoes_engine(app.config['DATABASE_REPLICA_URL']), url=app.config['DATABASE_REPLICA_URL']),
+    }
+
+
+class SessaoRoteada(SessaoFlask):
+    """Manda as leituras das rotas marcadas com @leitura_na_replica para a réplica; o resto vai ao primário."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not getattr(clause, 'is_dml', False)
+                and has_request_context() and g.get('ler_da_replica') and 'replica' in self._db.engines):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(app, session_options={'class_': SessaoRoteada})
+
+
+@event.listens_for(Engine, 'connect')
+def configurar_conexao_sqlite(conexao_dbapi, registro):
+    """WAL deixa leitores e o escritor trabalharem juntos; busy_timeout espera o lock em vez
+    de falhar com 'database is locked' quando dois workers gravam ao mesmo tempo."""
+    if not isinstance(conexao_dbapi, sqlite3.Connection):
+        return
+    cursor = conexao_dbapi.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']:d}")
+    if app.config['SQLITE_SYNCHRONOUS'] in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        cursor.execute(f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}")
+    cursor.close()
+
+
+def descartar_conexoes_herdadas():
+    """No processo filho (gunicorn --preload, multiprocessing) as conexões do pai não podem ser reusadas."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=descartar_conexoes_herdadas)
+
+
+def objeto_fora_dos_modelos(objeto, nome, tipo, refletido, comparado_com):
+    """Estruturas da busca textual (migração 0003) não têm modelo; o autogenerate deve ignorá-las."""
+    if tipo == 'table' and nome and nome.startswith('produto_fts'):
+        return False
+    if tipo == 'column' and nome == 'busca' and objeto.table.name == 'produto':
+        return False
+    if tipo == 'index' and nome == 'ix_produto_busca':
+        return False
+    return True
+
+
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'),
+                  render_as_batch=True, include_object=objeto_fora_dos_modelos)
 
 
 # ── MODELOS ───────────────────────────────────────────────────────────────────
@@ -27,31 +196,58 @@ class AdminUser(db.Model):
     criado_em = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=app.config['SENHA_METODO_HASH'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def precisa_rehash(self):
+        """O hash foi gerado com método/parâmetros diferentes dos de SENHA_METODO_HASH?"""
+        return parametros_hash(self.password_hash) != parametros_hash(hash_referencia(app.config['SENHA_METODO_HASH']))
+
     def __repr__(self):
         return f'<AdminUser {self.username}>'
 
 
 class Produto(db.Model):
+    __table_args__ = (
+        db.Index('ix_produto_categoria_id', 'categoria', 'id'),  # vitrine por categoria (mais recentes)
+        db.Index('ix_produto_disponivel_id', 'disponivel', 'id'),  # /api/produtos
+        db.Index('ix_produto_preco_id', 'preco', 'id'),  # vitrine por preço
+        db.Index('ix_produto_categoria_preco_id', 'categoria', 'preco', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
     descricao = db.Column(db.Text, nullable=False)
     preco = db.Column(db.Float, nullable=False)
     imagem_url = db.Column(db.String(200))
+    imagem_hash = db.Column(db.String(16))       # foto enviada (sha256 do original, 16 hex)
+    imagem_larguras = db.Column(db.String(50))   # variantes prontas, ex. "320,640,1024"; None = processando
     prazo_dias = db.Column(db.Integer, default=7)
     categoria = db.Column(db.String(50))
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     disponivel = db.Column(db.Boolean, default=True)
 
+    @property
+    def imagem(self):
+        """URLs das variantes da foto enviada, prontas para srcset; None se não houver (ou ainda processando)."""
+        return urls_imagem(self.imagem_hash, self.imagem_larguras)
+
     def __repr__(self):
         return f'<Produto {self.nome}>'
 
 
 class Pedido(db.Model):
+    __table_args__ = (
+        db.Index('ix_pedido_data_pedido_id', 'data_pedido', 'id'),  # cursor do admin
+        db.Index('ix_pedido_status_data_pedido', 'status', 'data_pedido'),
+        db.Index('ix_pedido_status_pagamento_data_pedido', 'status_pagamento', 'data_pedido'),
+        db.Index('ix_pedido_preference_id', 'preference_id'),
+        db.Index('ix_pedido_payment_id', 'payment_id'),
+        db.Index('ix_pedido_chave_idempotencia', 'chave_idempotencia', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     nome_cliente = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), nullable=False)
@@ -61,19 +257,98 @@ class Pedido(db.Model):
     quantidade = db.Column(db.Integer, nullable=False)
     total = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='Pendente')
-    status_pagamento = db.Column(db.String(20), default='Pendente')
+    # active_history: o resumo de vendas precisa do valor anterior mesmo se ele não estava carregado
+    status_pagamento = db.column_property(db.Column(db.String(20), default='Pendente'), active_history=True)
     payment_id = db.Column(db.String(100))
     preference_id = db.Column(db.String(100))
+    init_point = db.Column(db.String(500))
+    # Checkout idempotente: a chave vem do formulário; o hash confere se o reenvio é o mesmo pedido
+    chave_idempotencia = db.Column(db.String(64))
+    hash_checkout = db.Column(db.String(64))
+    preferencia_em_criacao = db.Column(db.DateTime)  # alguém está chamando o MP para este pedido desde...
     data_pedido = db.Column(db.DateTime, default=datetime.utcnow)
 
     produto = db.relationship('Produto', backref='pedidos')
+    itens = db.relationship('ItemPedido', backref='pedido', cascade='all, delete-orphan',
+                            order_by='ItemPedido.id')
+
+    @property
+    def resumo_itens(self):
+        """Texto curto com os produtos do pedido (pedidos antigos só têm `produto`)."""
+        if self.itens:
+            return ', '.join(f'{i.nome_produto} × {i.quantidade}' for i in self.itens)
+        return self.produto.nome if self.produto else 'N/A'
+
+    @property
+    def prazo_dias(self):
+        prazos = [i.produto.prazo_dias for i in self.itens if i.produto]
+        if not prazos and self.produto:
+            prazos = [self.produto.prazo_dias]
+        return max(prazos, default=None)
+
+
+class ItemPedido(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedido.id'), nullable=False, index=True)
+    # O item guarda nome e preço, então sobrevive ao produto: apagado o produto, fica NULL
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id', ondelete='SET NULL'), index=True)
+    # Nome e preço congelados no momento da compra — o produto pode mudar depois
+    nome_produto = db.Column(db.String(100), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)
+    preco_unitario = db.Column(db.Float, nullable=False)
+
+    produto = db.relationship('Produto')
+
+    @property
+    def subtotal(self):
+        return self.preco_unitario * self.quantidade
+
+
+class EventoWebhook(db.Model):
+    """Caixa de entrada das notificações do Mercado Pago, processada pelo comando `processar-webhooks`."""
+    __table_args__ = (
+        db.Index('ix_evento_webhook_tipo_recurso', 'tipo', 'recurso_id', 'processado_em'),
+        db.Index('ix_evento_webhook_pendentes', 'processado_em', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    recurso_id = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text)
+    recebido_em = db.Column(db.DateTime, default=datetime.utcnow)
+    processado_em = db.Column(db.DateTime)
+    tentativas = db.Column(db.Integer, default=0, nullable=False)
+    erro = db.Column(db.Text)
+
+
+class VendaDiaria(db.Model):
+    """Resumo de vendas por dia e status de pagamento, mantido a cada flush (ver RESUMO DE VENDAS)."""
+    dia = db.Column(db.Date, primary_key=True)
+    status_pagamento = db.Column(db.String(20), primary_key=True)
+    pedidos = db.Column(db.Integer, nullable=False, default=0)
+    unidades = db.Column(db.Integer, nullable=False, default=0)
+    receita = db.Column(db.Float, nullable=False, default=0)
+
+
+class VendaDiariaProduto(db.Model):
+    """Mesmo resumo, aberto por produto; a categoria vem do join com `produto` na hora de ler."""
+    __table_args__ = (
+        db.Index('ix_venda_diaria_produto_status_dia', 'status_pagamento', 'dia'),
+    )
+
+    dia = db.Column(db.Date, primary_key=True)
+    produto_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    status_pagamento = db.Column(db.String(20), primary_key=True)
+    pedidos = db.Column(db.Integer, nullable=False, default=0)
+    unidades = db.Column(db.Integer, nullable=False, default=0)
+    receita = db.Column(db.Float, nullable=False, default=0)
 
 
 # ── SETUP DO BANCO ────────────────────────────────────────────────────────────
 
 def init_db():
-    """Cria as tabelas e o admin padrão se não existir nenhum usuário."""
-    db.create_all()
+    """Aplica as migrações pendentes e cria o admin padrão se não existir nenhum usuário."""
+    migrar_banco()
     if AdminUser.query.count() == 0:
         username = os.environ.get('ADMIN_USERNAME', 'sua-chave-secreta-aqui')
         password = os.environ.get('ADMIN_PASSWORD', 'sua-chave-secreta-aqui')
@@ -84,9 +359,832 @@ def init_db():
         print(f"[!] Admin padrão criado: usuario='{username}' — troque a senha pelo painel!")
 
 
-if os.getenv("RENDER"):
-    with app.app_context():
-        init_db()
+@app.cli.command('inicializar')
+@click.option('--assets', is_flag=True, help='Também gera os assets estáticos (construir-assets).')
+def inicializar_command(assets):
+    """Prepara o banco para o deploy — rode uma vez por deploy, antes de subir os workers."""
+    init_db()
+    click.echo('Banco migrado.')
+    if assets:
+        construir_assets()
+        click.echo('Assets gerados.')
+
+
+def leitura_na_replica(f):
+    """Rotas só de leitura da vitrine: as consultas vão para DATABASE_REPLICA_URL, se configurada."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.ler_da_replica = True
+        return f(*args, **kwargs)
+    return decorated
+
+
+@contextmanager
+def leitura_no_primario():
+    """Dentro do bloco as consultas vão ao primário, mesmo numa rota @leitura_na_replica."""
+    if not has_request_context():
+        yield
+        return
+    anterior = g.get('ler_da_replica')
+    g.ler_da_replica = False
+    try:
+        yield
+    finally:
+        g.ler_da_replica = anterior
+
+
+# ── MÉTRICAS ──────────────────────────────────────────────────────────────────
+# Tudo em memória, por processo: cada worker do gunicorn expõe os próprios números.
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def criar_logger(nome, nivel):
+    """Logger que escreve uma linha (JSON) por evento no stdout, sem passar pelo logger raiz."""
+    logger = logging.getLogger(nome)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(nivel)
+        logger.propagate = False
+    return logger
+
+
+log_requisicoes = criar_logger('croche.requisicoes', logging.INFO)
+log_sql = criar_logger('croche.sql', logging.WARNING)
+
+
+class RegistroMetricas:
+    """Contadores e histogramas exportados no formato texto do Prometheus."""
+
+    def __init__(self):
+        self.definicoes = {}  # nome -> (tipo, ajuda, buckets)
+        self._contadores = {}
+        self._histogramas = {}
+        self._lock = threading.Lock()
+
+    def contador(self, nome, ajuda):
+        self.definicoes[nome] = ('counter', ajuda, None)
+
+    def histograma(self, nome, ajuda, buckets=BUCKETS_SEGUNDOS):
+        self.definicoes[nome] = ('histogram', ajuda, buckets)
+
+    def incrementar(self, nome, labels, valor=1):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, labels, valor):
+        buckets = self.definicoes[nome][2]
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._histogramas.get(chave)
+            if h is None:
+                h = self._histogramas[chave] = {'buckets': [0] * len(buckets), 'soma': 0.0, 'total': 0}
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    h['buckets'][i] += 1
+                    break
+            h['soma'] += valor
+            h['total'] += 1
+
+    @staticmethod
+    def _labels(pares):
+        if not pares:
+            return ''
+        texto = ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                         for k, v in pares)
+        return '{' + texto + '}'
+
+    def exportar(self, extras=()):
+        """Texto no formato de exposição do Prometheus. `extras`: [(nome, tipo, ajuda, [(labels, valor)])]."""
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {k: dict(v, buckets=list(v['buckets'])) for k, v in self._histogramas.items()}
+
+        linhas = []
+        for nome, (tipo, ajuda, buckets) in self.definicoes.items():
+            linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+            if tipo == 'counter':
+                for (n, pares), valor in sorted(contadores.items()):
+                    if n == nome:
+                        linhas.append(f'{nome}{self._labels(pares)} {valor}')
+                continue
+            for (n, pares), h in sorted(histogramas.items()):
+                if n != nome:
+                    continue
+                acumulado = 0
+                for limite, quantidade in zip(buckets, h['buckets']):
+                    acumulado += quantidade
+                    linhas.append(f'{nome}_bucket{self._labels(pares + (("le", limite),))} {acumulado}')
+                linhas.append(f'{nome}_bucket{self._labels(pares + (("le", "+Inf"),))} {h["total"]}')
+                linhas.append(f'{nome}_sum{self._labels(pares)} {round(h["soma"], 6)}')
+                linhas.append(f'{nome}_count{self._labels(pares)} {h["total"]}')
+        for nome, tipo, ajuda, amostras in extras:
+            linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}']
+            linhas += [f'{nome}{self._labels(tuple(sorted(labels.items())))} {valor}' for labels, valor in amostras]
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = RegistroMetricas()
+metricas.contador('croche_requisicoes_total', 'Requisições atendidas, por endpoint e status.')
+metricas.histograma('croche_requisicao_segundos', 'Latência das requisições, por endpoint.')
+metricas.histograma('croche_requisicao_consultas', 'Consultas SQL por requisição.', BUCKETS_CONSULTAS)
+metricas.histograma('croche_requisicao_sql_segundos', 'Tempo em SQL por requisição.')
+metricas.histograma('croche_requisicao_template_segundos', 'Tempo renderizando templates por requisição.')
+metricas.histograma('croche_requisicao_http_saida_segundos', 'Tempo em chamadas HTTP externas por requisição.')
+metricas.histograma('croche_http_saida_segundos', 'Latência de cada chamada ao Mercado Pago, por operação.')
+metricas.contador('croche_sql_lentas_total', 'Consultas acima de SQL_LENTA_MS.')
+metricas.contador('croche_login_tentativas_total', 'Tentativas de login do admin, por resultado.')
+
+
+def medicao_atual():
+    return g.get('medicao') if has_request_context() else None
+
+
+@app.before_request
+def iniciar_medicao():
+    g.medicao = {'inicio': time.perf_counter(), 'consultas': 0, 'sql': 0.0, 'templates': 0.0, 'http': 0.0}
+
+
+@app.after_request
+def anotar_status(resp):
+    g.status_resposta = resp.status_code
+    return resp
+
+
+@app.teardown_request
+def registrar_requisicao(exc):
+    medicao = g.pop('medicao', None)
+    if medicao is None:
+        return
+    segundos = time.perf_counter() - medicao['inicio']
+    endpoint = request.endpoint or 'sem_rota'  # 404: não usa a URL como label
+    status = 500 if exc else g.get('status_resposta', 500)
+
+    metricas.incrementar('croche_requisicoes_total', {'endpoint': endpoint, 'metodo': request.method, 'status': status})
+    metricas.observar('croche_requisicao_segundos', {'endpoint': endpoint}, segundos)
+    metricas.observar('croche_requisicao_consultas', {'endpoint': endpoint}, medicao['consultas'])
+    metricas.observar('croche_requisicao_sql_segundos', {'endpoint': endpoint}, medicao['sql'])
+    metricas.observar('croche_requisicao_template_segundos', {'endpoint': endpoint}, medicao['templates'])
+    metricas.observar('croche_requisicao_http_saida_segundos', {'endpoint': endpoint}, medicao['http'])
+
+    if app.config['LOG_REQUISICOES_JSON']:
+        log_requisicoes.info(json.dumps({
+            'ts': datetime.utcnow().isoformat(timespec='milliseconds') + 'Z',
+            'metodo': request.method, 'caminho': request.path, 'endpoint': endpoint, 'status': status,
+            'ms': round(segundos * 1000, 2), 'consultas': medicao['consultas'],
+            'sql_ms': round(medicao['sql'] * 1000, 2), 'template_ms': round(medicao['templates'] * 1000, 2),
+            'http_ms': round(medicao['http'] * 1000, 2),
+        }, ensure_ascii=False))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def iniciar_consulta(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.inicio_metricas = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def registrar_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, 'inicio_metricas', None)
+    if inicio is None:
+        return
+    segundos = time.perf_counter() - inicio
+    medicao = medicao_atual()
+    if medicao is not None:
+        medicao['consultas'] += 1
+        medicao['sql'] += segundos
+    if segundos * 1000 >= app.config['SQL_LENTA_MS']:
+        metricas.incrementar('croche_sql_lentas_total', {})
+        log_sql.warning(json.dumps({
+            'evento': 'consulta_lenta', 'ms': round(segundos * 1000, 2),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'sql': ' '.join(statement.split())[:2000],
+        }, ensure_ascii=False))
+
+
+@before_render_template.connect_via(app)
+def iniciar_template(sender, template, context, **extra):
+    if medicao_atual() is not None:
+        g.setdefault('templates_abertos', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def registrar_template(sender, template, context, **extra):
+    medicao = medicao_atual()
+    if medicao is not None and g.get('templates_abertos'):
+        inicio = g.templates_abertos.pop()
+        if not g.templates_abertos:  # só o mais externo, para não contar duas vezes
+            medicao['templates'] += time.perf_counter() - inicio
+
+
+def registrar_http_saida(operacao, segundos, erro):
+    metricas.observar('croche_http_saida_segundos', {'operacao': operacao, 'resultado': 'erro' if erro else 'ok'},
+                      segundos)
+    medicao = medicao_atual()
+    if medicao is not None:
+        medicao['http'] += segundos
+
+
+# ── CACHE DO CATÁLOGO ─────────────────────────────────────────────────────────
+#
+# O catálogo só muda quando a admin cria, edita ou deleta um produto, então as
+# rotas públicas leem de um cache versionado. As chaves levam a versão atual do
+# catálogo; invalidar é só incrementar a versão (as entradas antigas expiram
+# sozinhas pelo TTL/LRU).
+
+class CacheMemoria:
+    """LRU em memória com TTL. Vale apenas para o processo (worker) atual."""
+
+    def __init__(self, max_itens=512, ttl=300):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._dados = OrderedDict()
+        self._versoes = {}
+        self._lock = threading.Lock()
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return padrao
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._dados[chave]
+                return padrao
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor, ttl=None):
+        with self._lock:
+            self._dados[chave] = (time.monotonic() + (ttl or self.ttl), valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_itens:
+                self._dados.popitem(last=False)
+
+    def versao(self, nome):
+        with self._lock:
+            return self._versoes.get(nome, 0)
+
+    def incr_versao(self, nome):
+        with self._lock:
+            self._versoes[nome] = self._versoes.get(nome, 0) + 1
+            return self._versoes[nome]
+
+
+class CacheRedis:
+    """Backend compartilhado entre workers do gunicorn (requer o pacote `redis`)."""
+
+    def __init__(self, url, ttl=300):
+        import redis  # dependência opcional — só necessária com CATALOGO_CACHE_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, chave, padrao=None):
+        bruto = self._redis.get(chave)
+        return padrao if bruto is None else json.loads(bruto)
+
+    def set(self, chave, valor, ttl=None):
+        self._redis.set(chave, json.dumps(valor), ex=ttl or self.ttl)
+
+    def versao(self, nome):
+        bruto = self._redis.get(nome)
+        if bruto is None:
+            # Se a chave de versão sumir (eviction/restart), recomeça de um valor
+            # baseado no relógio para nunca reaproveitar entradas antigas.
+            self._redis.set(nome, int(time.time() * 1000), nx=True)
+            bruto = self._redis.get(nome)
+        return int(bruto)
+
+    def incr_versao(self, nome):
+        return self._redis.incr(nome)
+
+
+class CacheCatalogo:
+    """Cache de leitura do catálogo com invalidação por versão e contadores de hit/miss."""
+
+    _AUSENTE = object()
+    CHAVE_VERSAO = 'catalogo:versao'
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def versao(self):
+        return self.backend.versao(self.CHAVE_VERSAO)
+
+    def invalidar(self):
+        return self.backend.incr_versao(self.CHAVE_VERSAO)
+
+    def obter(self, nome, carregar, ttl=None):
+        """Devolve `nome` do cache na versão atual; em caso de miss chama `carregar()`."""
+        chave = f'catalogo:{self.versao()}:{nome}'
+        valor = self.backend.get(chave, self._AUSENTE)
+        if valor is not self._AUSENTE:
+            self.hits += 1
+            return valor
+        self.misses += 1
+        # A recarga lê do primário: logo depois de uma invalidação, a réplica atrasada ainda
+        # devolveria o catálogo antigo, que ficaria guardado na versão nova por todo o TTL
+        with leitura_no_primario():
+            valor = carregar()
+        self.backend.set(chave, valor, ttl)
+        return valor
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'versao': self.versao(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def criar_cache_catalogo():
+    ttl = app.config['CATALOGO_CACHE_TTL']
+    if app.config['CATALOGO_CACHE_BACKEND'] == 'redis' and app.config['CACHE_REDIS_URL']:
+        return CacheCatalogo(CacheRedis(app.config['CACHE_REDIS_URL'], ttl=ttl))
+    return CacheCatalogo(CacheMemoria(max_itens=app.config['CATALOGO_CACHE_MAX_ITENS'], ttl=ttl))
+
+
+catalogo_cache = criar_cache_catalogo()
+
+
+def produto_para_dict(p):
+    """Snapshot serializável de um Produto — é o que vai para o cache e para os templates."""
+    return {
+        'id': p.id,
+        'nome': p.nome,
+        'descricao': p.descricao,
+        'preco': p.preco,
+        'imagem_url': p.imagem_url,
+        'imagem': p.imagem,
+        'prazo_dias': p.prazo_dias,
+        'categoria': p.categoria,
+        'disponivel': p.disponivel,
+    }
+
+
+def produto_para_card(p, resumo):
+    """Como produto_para_dict, mas para listagens: a descrição inteira fica no banco (coluna
+    adiada) e o card recebe só o começo dela, cortado em RESUMO_DESCRICAO caracteres."""
+    if resumo and len(resumo) > RESUMO_DESCRICAO:
+        resumo = resumo[:RESUMO_DESCRICAO].rstrip() + '…'
+    return {
+        'id': p.id,
+        'nome': p.nome,
+        'resumo': resumo,
+        'preco': p.preco,
+        'imagem_url': p.imagem_url,
+        'imagem': p.imagem,
+        'categoria': p.categoria,
+        'disponivel': p.disponivel,
+    }
+
+
+# ── GATEWAY MERCADO PAGO ──────────────────────────────────────────────────────
+#
+# O SDK oficial abre uma sessão HTTP nova a cada chamada, usa timeout de 60s e
+# refaz a requisição sem espera entre tentativas. Como os workers do gunicorn são
+# poucos, um MP lento travaria a loja inteira. O gateway abaixo reaproveita
+# conexões, limita o tempo de cada chamada, refaz com backoff + jitter e abre o
+# disjuntor (falha rápido) quando o MP está fora.
+
+MP_API_URL_PADRAO = 'https://api.mercadopago.com'
+
+
+class ErroGateway(Exception):
+    """Falha ao falar com o Mercado Pago (timeout, erro HTTP ou resposta inválida)."""
+
+
+class DisjuntorAberto(ErroGateway):
+    """O disjuntor está aberto — a chamada nem foi tentada."""
+
+
+class HttpClientMP(HttpClient):
+    """HttpClient do SDK com sessão keep-alive compartilhada e timeout (conexão, leitura).
+
+    As novas tentativas ficam a cargo do GatewayMercadoPago, então aqui não há retry.
+    Também permite apontar o SDK para outra URL base (ex.: o fake_mp.py nos testes).
+    """
+
+    def __init__(self, base_url=MP_API_URL_PADRAO, timeout=(3.05, 8), pool_conexoes=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = http_requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=pool_conexoes, max_retries=0)
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+
+    def request(self, method, url, maxretries=None, timeout=None, **kwargs):
+        if url.startswith(MP_API_URL_PADRAO):
+            url = self.base_url + url[len(MP_API_URL_PADRAO):]
+        api_result = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        response = {'status': api_result.status_code, 'response': None}
+        if api_result.status_code != 204 and api_result.content:
+            try:
+                response['response'] = api_result.json()
+            except ValueError:
+                raise ErroGateway(f'Resposta não-JSON do MP (HTTP {api_result.status_code})')
+        return response
+
+
+class Disjuntor:
+    """Circuit breaker: abre após N falhas seguidas e deixa passar uma chamada de teste após `reset` segundos."""
+
+    def __init__(self, limite_falhas=5, reset=30.0):
+        self.limite_falhas = limite_falhas
+        self.reset = reset
+        self.falhas = 0
+        self.aberto_em = None
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.aberto_em is None:
+            return 'fechado'
+        return 'meio-aberto' if time.monotonic() - self.aberto_em >= self.reset else 'aberto'
+
+    def permitir(self):
+        with self._lock:
+            if self.aberto_em is None:
+                return True
+            if time.monotonic() - self.aberto_em >= self.reset:
+                self.aberto_em = time.monotonic()  # uma chamada de teste por janela
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self.aberto_em = None
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.falhas >= self.limite_falhas:
+                self.aberto_em = time.monotonic()
+
+
+class GatewayMercadoPago:
+    """Todas as chamadas ao Mercado Pago passam por aqui."""
+
+    STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+    def __init__(self, access_token, base_url=MP_API_URL_PADRAO, timeout=(3.05, 8), prazo_total=15.0,
+                 max_tentativas=2, pool_conexoes=10, disjuntor=None):
+        self.access_token = access_token
+        self.http = HttpClientMP(base_url, timeout=timeout, pool_conexoes=pool_conexoes)
+        self.sdk = mercadopago.SDK(access_token or 'sem-token', http_client=self.http)
+        self.prazo_total = prazo_total
+        self.max_tentativas = max_tentativas
+        self.disjuntor = disjuntor or Disjuntor()
+        self.metricas = {}
+        self._lock = threading.Lock()
+
+    @property
+    def configurado(self):
+        return bool(self.access_token)
+
+    def criar_preferencia(self, dados):
+        return self._chamar('preference.create', lambda: self.sdk.preference().create(dados))
+
+    def consultar_pagamento(self, payment_id):
+        return self._chamar('payment.get', lambda: self.sdk.payment().get(payment_id))
+
+    def buscar_pagamentos(self, filtros):
+        return self._chamar('payment.search', lambda: self.sdk.payment().search(filtros))
+
+    def trocar_codigo_oauth(self, dados):
+        return self._chamar('oauth.token', lambda: self.http.post(
+            MP_API_URL_PADRAO + '/oauth/token', headers={'Content-Type': 'application/json'},
+            data=json.dumps(dados)))
+
+    def _registrar(self, operacao, segundos, erro):
+        registrar_http_saida(operacao, segundos, erro)
+        with self._lock:
+            m = self.metricas.setdefault(operacao, {'chamadas': 0, 'erros': 0,
+                                                    'segundos_total': 0.0, 'segundos_max': 0.0})
+            m['chamadas'] += 1
+            m['erros'] += 1 if erro else 0
+            m['segundos_total'] += segundos
+            m['segundos_max'] = max(m['segundos_max'], segundos)
+
+    def _chamar(self, operacao, fazer_chamada):
+        if not self.disjuntor.permitir():
+            raise DisjuntorAberto(f'{operacao}: Mercado Pago indisponível (disjuntor aberto)')
+
+        inicio_total = time.monotonic()
+        erro = None
+        for tentativa in range(1, self.max_tentativas + 1):
+            inicio = time.perf_counter()
+            try:
+                resposta = fazer_chamada()
+            except (http_requests.RequestException, ErroGateway) as e:
+                erro = e
+            else:
+                status = resposta.get('status', 200)
+                if status not in self.STATUS_RETENTAVEIS:
+                    self._registrar(operacao, time.perf_counter() - inicio, status >= 400)
+                    self.disjuntor.sucesso()  # 4xx é erro nosso, não do MP
+                    if status >= 400:
+                        raise ErroGateway(f'{operacao}: HTTP {status} {resposta.get("response")}')
+                    return resposta.get('response') or {}
+                erro = ErroGateway(f'{operacao}: HTTP {status}')
+            self._registrar(operacao, time.perf_counter() - inicio, True)
+
+            # Backoff exponencial com jitter total, respeitando o prazo da chamada
+            espera = random.uniform(0, min(2.0, 0.25 * 2 ** (tentativa - 1)))
+            if tentativa == self.max_tentativas or time.monotonic() - inicio_total + espera > self.prazo_total:
+                break
+            time.sleep(espera)
+
+        self.disjuntor.falha()
+        raise ErroGateway(f'{operacao}: falhou após {tentativa} tentativa(s): {erro}') from erro
+
+    def stats(self):
+        with self._lock:
+            metricas = {op: dict(m, segundos_medio=round(m['segundos_total'] / m['chamadas'], 4))
+                        for op, m in self.metricas.items()}
+        return {'configurado': self.configurado, 'disjuntor': self.disjuntor.estado,
+                'falhas_seguidas': self.disjuntor.falhas, 'operacoes': metricas}
+
+
+gateway_mp = GatewayMercadoPago(
+    MERCADOPAGO_ACCESS_TOKEN,
+    base_url=app.config['MP_API_URL'],
+    timeout=(app.config['MP_TIMEOUT_CONEXAO'], app.config['MP_TIMEOUT_LEITURA']),
+    prazo_total=app.config['MP_PRAZO_TOTAL'],
+    max_tentativas=app.config['MP_MAX_TENTATIVAS'],
+    pool_conexoes=app.config['MP_POOL_CONEXOES'],
+    disjuntor=Disjuntor(app.config['MP_DISJUNTOR_FALHAS'], app.config['MP_DISJUNTOR_RESET']),
+)
+
+
+# ── IMAGENS DE PRODUTOS ───────────────────────────────────────────────────────
+# O upload só valida e guarda o original; as variantes são geradas numa thread à
+# parte. Os arquivos têm o hash do original no nome, então nunca mudam de conteúdo
+# e podem ser cacheados para sempre pelo navegador/CDN.
+
+IMAGENS_FORMATOS_ACEITOS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+IMAGENS_MAX_PIXELS = 40_000_000
+IMAGENS_CACHE_SEGUNDOS = 365 * 24 * 3600
+
+imagens_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='imagens')
+
+
+def pasta_imagens(*partes):
+    return os.path.join(app.config['IMAGENS_PASTA'], *partes)
+
+
+def urls_imagem(imagem_hash, larguras):
+    if not imagem_hash or not larguras:
+        return None
+    larguras = [int(w) for w in larguras.split(',')]
+
+    def url(largura, formato):
+        return url_for('imagem_produto', nome=f'{imagem_hash}-{largura}.{formato}')
+
+    return {
+        'src': url(larguras[len(larguras) // 2], 'jpg'),
+        'miniatura': url(larguras[0], 'jpg'),
+        'srcset_jpg': ', '.join(f'{url(w, "jpg")} {w}w' for w in larguras),
+        'srcset_webp': ', '.join(f'{url(w, "webp")} {w}w' for w in larguras),
+    }
+
+
+def receber_imagem(arquivo):
+    """Valida a foto enviada e guarda o original; devolve o hash. Levanta ValueError se inválida."""
+    dados = arquivo.read()
+    try:
+        with Image.open(io.BytesIO(dados)) as img:
+            formato, (largura, altura) = img.format, img.size
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise ValueError('Arquivo de imagem inválido ou corrompido.')
+    if formato not in IMAGENS_FORMATOS_ACEITOS:
+        raise ValueError('Formato não suportado — envie JPG, PNG, WebP ou GIF.')
+    if largura * altura > IMAGENS_MAX_PIXELS:
+        raise ValueError('Imagem grande demais — reduza para menos de 40 megapixels.')
+
+    imagem_hash = hashlib.sha256(dados).hexdigest()[:16]
+    destino = pasta_imagens('originais', imagem_hash)
+    if not os.path.exists(destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino + '.tmp', 'wb') as f:
+            f.write(dados)
+        os.replace(destino + '.tmp', destino)
+    return imagem_hash
+
+
+def gerar_variantes(imagem_hash):
+    """Gera JPEG e WebP em cada largura configurada (sem ampliar); devolve as larguras geradas."""
+    with Image.open(pasta_imagens('originais', imagem_hash)) as original:
+        img = ImageOps.exif_transpose(original)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            fundo = Image.new('RGB', img.size, 'white')
+            fundo.paste(img, mask=img.getchannel('A'))
+            img = fundo
+        else:
+            img = img.convert('RGB')
+
+    larguras = sorted({min(w, img.width) for w in app.config['IMAGENS_LARGURAS']})
+    for largura in larguras:
+        variante = img if largura == img.width else img.resize(
+            (largura, round(img.height * largura / img.width)), Image.LANCZOS)
+        for formato, opcoes in (('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+                                ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4})):
+            destino = pasta_imagens(f'{imagem_hash}-{largura}.{formato}')
+            if not os.path.exists(destino):
+                variante.save(destino + '.tmp', **opcoes)
+                os.replace(destino + '.tmp', destino)
+    return larguras
+
+
+def processar_imagem_produto(produto_id, imagem_hash):
+    """Gera as variantes e marca o produto como pronto (se a foto não foi trocada nesse meio-tempo)."""
+    larguras = gerar_variantes(imagem_hash)
+    db.session.execute(
+        update(Produto)
+        .where(Produto.id == produto_id, Produto.imagem_hash == imagem_hash)
+        .values(imagem_larguras=','.join(map(str, larguras))))
+    db.session.commit()
+    catalogo_cache.invalidar()
+
+
+def agendar_processamento_imagem(produto_id, imagem_hash):
+    def tarefa():
+        with app.app_context():
+            try:
+                processar_imagem_produto(produto_id, imagem_hash)
+            except Exception:
+                app.logger.exception('Falha ao processar a imagem %s do produto %s', imagem_hash, produto_id)
+
+    imagens_executor.submit(tarefa)
+
+
+def aplicar_upload_imagem(produto):
+    """Troca a foto do produto se veio arquivo no form; devolve o hash a processar (ou None)."""
+    arquivo = request.files.get('imagem_arquivo')
+    if not arquivo or not arquivo.filename:
+        return None
+    imagem_hash = receber_imagem(arquivo)
+    if imagem_hash == produto.imagem_hash and produto.imagem_larguras:
+        return None
+    produto.imagem_hash, produto.imagem_larguras = imagem_hash, None
+    return imagem_hash
+
+
+@app.route('/imagens/<nome>')
+def imagem_produto(nome):
+    resp = send_from_directory(app.config['IMAGENS_PASTA'], nome, max_age=IMAGENS_CACHE_SEGUNDOS)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+@app.cli.command('processar-imagens')
+@click.option('--todas', is_flag=True, help='Regera todas as fotos (ex.: depois de mudar IMAGENS_LARGURAS).')
+def processar_imagens_command(todas):
+    """Gera as variantes pendentes (uploads cujo processamento foi interrompido)."""
+    consulta = Produto.query.filter(Produto.imagem_hash.isnot(None))
+    if not todas:
+        consulta = consulta.filter(Produto.imagem_larguras.is_(None))
+    pendentes = consulta.with_entities(Produto.id, Produto.imagem_hash).all()
+    for produto_id, imagem_hash in pendentes:
+        processar_imagem_produto(produto_id, imagem_hash)
+    click.echo(f'{len(pendentes)} imagem(ns) processada(s).')
+
+
+# ── ASSETS ESTÁTICOS E COMPRESSÃO ─────────────────────────────────────────────
+# `flask --app app construir-assets` minifica o CSS/JS de static/ e grava em
+# static/dist cópias com o hash do conteúdo no nome (mais .gz e .br) e um
+# manifest.json. Os templates usam `asset_url('css/produtos.css')`; sem build,
+# o helper cai no arquivo original em /static.
+
+ASSETS_PASTA_DIST = os.path.join(app.static_folder, 'dist')
+ASSETS_EXTENSOES = ('.css', '.js', '.jpg', '.jpeg', '.png', '.svg', '.ico', '.webp')
+ASSETS_COMPRIMIVEIS = ('.css', '.js', '.svg')
+ASSETS_CACHE_SEGUNDOS = 365 * 24 * 3600
+HTML_MIN_BYTES_GZIP = 500
+
+_manifest_assets = {'mtime': None, 'mapa': {}}
+
+
+def manifest_assets():
+    """Mapa nome lógico → arquivo versionado; relido só quando o build gera um novo manifest."""
+    caminho = os.path.join(ASSETS_PASTA_DIST, 'manifest.json')
+    try:
+        mtime = os.path.getmtime(caminho)
+    except OSError:
+        return {}
+    if mtime != _manifest_assets['mtime']:
+        with open(caminho, encoding='utf-8') as f:
+            _manifest_assets.update(mtime=mtime, mapa=json.load(f))
+    return _manifest_assets['mapa']
+
+
+@app.template_global()
+def asset_url(nome):
+    versionado = manifest_assets().get(nome)
+    if versionado:
+        return url_for('asset_versionado', nome=versionado)
+    return url_for('static', filename=nome)
+
+
+@app.route('/assets/<path:nome>')
+def asset_versionado(nome):
+    """Serve o asset versionado, já comprimido (br/gzip) quando o navegador aceita."""
+    for codificacao, sufixo in (('br', '.br'), ('gzip', '.gz')):
+        caminho = safe_join(ASSETS_PASTA_DIST, nome + sufixo)
+        if request.accept_encodings[codificacao] and caminho and os.path.isfile(caminho):
+            resp = send_from_directory(ASSETS_PASTA_DIST, nome + sufixo, max_age=ASSETS_CACHE_SEGUNDOS,
+                                       mimetype=mimetypes.guess_type(nome)[0])
+            resp.headers['Content-Encoding'] = codificacao
+            break
+    else:
+        resp = send_from_directory(ASSETS_PASTA_DIST, nome, max_age=ASSETS_CACHE_SEGUNDOS)
+    resp.vary.add('Accept-Encoding')
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+def gravar_arquivo(destino, dados):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino + '.tmp', 'wb') as f:
+        f.write(dados)
+    os.replace(destino + '.tmp', destino)
+
+
+def construir_assets():
+    """Gera os assets versionados e o manifest; devolve [(nome, bytes originais, bytes gerados)]."""
+    import rcssmin, rjsmin  # só necessários no build
+    try:
+        import brotli  # opcional — sem ele saem só as variantes .gz
+    except ImportError:
+        brotli = None
+
+    manifest, relatorio = {}, []
+    for raiz, pastas, arquivos in os.walk(app.static_folder):
+        pastas[:] = sorted(p for p in pastas if os.path.join(raiz, p) != ASSETS_PASTA_DIST)
+        for arquivo in sorted(arquivos):
+            base, ext = os.path.splitext(arquivo)
+            if ext.lower() not in ASSETS_EXTENSOES:
+                continue
+            origem = os.path.join(raiz, arquivo)
+            nome = os.path.relpath(origem, app.static_folder).replace(os.sep, '/')
+            with open(origem, 'rb') as f:
+                original = f.read()
+            dados = original
+            if ext == '.css':
+                dados = rcssmin.cssmin(original.decode('utf-8')).encode('utf-8')
+            elif ext == '.js':
+                dados = rjsmin.jsmin(original.decode('utf-8')).encode('utf-8')
+
+            versionado = f'{nome[:-len(ext)]}.{hashlib.sha256(dados).hexdigest()[:12]}{ext}'
+            destino = os.path.join(ASSETS_PASTA_DIST, versionado)
+            gravar_arquivo(destino, dados)
+            if ext in ASSETS_COMPRIMIVEIS:
+                gravar_arquivo(destino + '.gz', gzip.compress(dados, compresslevel=9, mtime=0))
+                if brotli:
+                    gravar_arquivo(destino + '.br', brotli.compress(dados, quality=11))
+            manifest[nome] = versionado
+            relatorio.append((nome, len(original), len(dados)))
+
+    # Versões antigas ficam em dist/: páginas já cacheadas ainda podem pedi-las
+    gravar_arquivo(os.path.join(ASSETS_PASTA_DIST, 'manifest.json'),
+                   json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return relatorio
+
+
+@app.cli.command('construir-assets')
+def construir_assets_command():
+    """Minifica, versiona e pré-comprime os arquivos de static/ (rodar a cada deploy)."""
+    for nome, antes, depois in construir_assets():
+        click.echo(f'{nome}: {antes} → {depois} bytes')
+
+
+@app.after_request
+def comprimir_html(resp):
+    """HTML dinâmico sai com ETag (o GET condicional vira 304) e em gzip quando o navegador aceita."""
+    if (request.method not in ('GET', 'HEAD') or resp.status_code != 200 or resp.mimetype != 'text/html'
+            or resp.is_streamed or resp.direct_passthrough or 'Content-Encoding' in resp.headers):
+        return resp
+    resp.add_etag(weak=True)  # fraca: a mesma ETag vale para a versão gzip e a sem compressão
+    resp.make_conditional(request)
+    resp.vary.add('Accept-Encoding')
+    if resp.status_code == 200 and request.accept_encodings['gzip'] and resp.content_length >= HTML_MIN_BYTES_GZIP:
+        resp.set_data(gzip.compress(resp.get_data(), compresslevel=6))
+        resp.headers['Content-Encoding'] = 'gzip'
+    return resp
 
 
 # ── AUTENTICAÇÃO ──────────────────────────────────────────────────────────────
@@ -101,6 +1199,164 @@ def login_required(f):
     return decorated
 
 
+# Robôs tentam /admin/login sem parar. Cada tentativa passa primeiro pelo limitador, que
+# não consulta o banco nem calcula hash; só então o usuário é buscado e a senha conferida,
+# com no máximo LOGIN_HASHES_SIMULTANEOS verificações de scrypt ao mesmo tempo por processo,
+# para que uma rajada de logins não tire CPU e memória da vitrine.
+
+class LimitadorMemoria:
+    """Contadores de falhas em memória (LRU). Vale apenas para o processo (worker) atual."""
+
+    def __init__(self, max_chaves=10000):
+        self.max_chaves = max_chaves
+        self._dados = OrderedDict()  # chave -> (índice da janela, falhas nela, falhas na anterior, última falha)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _rolar(registro, indice):
+        if registro is None:
+            return 0, 0, 0.0
+        indice_registro, atual, anterior, ultima = registro
+        if indice_registro == indice:
+            return atual, anterior, ultima
+        return 0, (atual if indice_registro == indice - 1 else 0), ultima
+
+    def ler(self, chave, indice):
+        with self._lock:
+            return self._rolar(self._dados.get(chave), indice)
+
+    def somar(self, chave, indice, agora, janela):
+        with self._lock:
+            atual, anterior, _ = self._rolar(self._dados.get(chave), indice)
+            self._dados[chave] = (indice, atual + 1, anterior, agora)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_chaves:
+                self._dados.popitem(last=False)
+
+    def limpar(self, chave, indice):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+
+class LimitadorRedis:
+    """Contadores compartilhados entre workers do gunicorn (requer o pacote `redis`)."""
+
+    def __init__(self, url):
+        import redis  # dependência opcional — só necessária com LOGIN_LIMITE_BACKEND=redis
+        self._redis = redis.Redis.from_url(url)
+
+    def ler(self, chave, indice):
+        atual, anterior, ultima = self._redis.mget(
+            f'login:{chave}:{indice}', f'login:{chave}:{indice - 1}', f'login:{chave}:ultima')
+        return int(atual or 0), int(anterior or 0), float(ultima or 0)
+
+    def somar(self, chave, indice, agora, janela):
+        pipe = self._redis.pipeline()
+        pipe.incr(f'login:{chave}:{indice}')
+        pipe.expire(f'login:{chave}:{indice}', 2 * janela)
+        pipe.set(f'login:{chave}:ultima', agora, ex=2 * janela)
+        pipe.execute()
+
+    def limpar(self, chave, indice):
+        self._redis.delete(f'login:{chave}:{indice}', f'login:{chave}:{indice - 1}', f'login:{chave}:ultima')
+
+
+class LimitadorLogin:
+    """Falhas de login por IP e por usuário numa janela deslizante: as falhas da janela atual
+    mais as da anterior, ponderadas pelo quanto dela ainda cai nos últimos `janela` segundos.
+    Passado o limite, cada falha a mais dobra o bloqueio (até `bloqueio_max`)."""
+
+    def __init__(self, backend, janela=900, max_falhas_ip=20, max_falhas_usuario=5,
+                 bloqueio=30.0, bloqueio_max=3600.0):
+        self.backend = backend
+        self.janela = janela
+        self.max_falhas_ip = max_falhas_ip
+        self.max_falhas_usuario = max_falhas_usuario
+        self.bloqueio = bloqueio
+        self.bloqueio_max = bloqueio_max
+
+    def _chaves(self, ip, usuario):
+        return ((f'ip:{ip}', self.max_falhas_ip),
+                (f'usuario:{usuario.lower()[:80]}', self.max_falhas_usuario))
+
+    def _espera(self, chave, limite, agora):
+        indice, decorrido = divmod(agora, self.janela)
+        atual, anterior, ultima = self.backend.ler(chave, int(indice))
+        falhas = atual + anterior * (1 - decorrido / self.janela)
+        if falhas < limite:
+            return 0.0
+        excesso = min(math.ceil(falhas - limite), 16)
+        return max(0.0, ultima + min(self.bloqueio_max, self.bloqueio * 2 ** excesso) - agora)
+
+    def espera(self, ip, usuario):
+        """Segundos até a próxima tentativa ser aceita (0: pode tentar agora)."""
+        agora = time.time()
+        return max(self._espera(chave, limite, agora) for chave, limite in self._chaves(ip, usuario))
+
+    def falha(self, ip, usuario):
+        agora = time.time()
+        for chave, _ in self._chaves(ip, usuario):
+            self.backend.somar(chave, int(agora // self.janela), agora, self.janela)
+
+    def sucesso(self, usuario):
+        # Só o contador do usuário: o do IP continua valendo para quem testa várias contas
+        chave, _ = self._chaves(None, usuario)[1]
+        self.backend.limpar(chave, int(time.time() // self.janela))
+
+
+def criar_limitador_login():
+    if app.config['LOGIN_LIMITE_BACKEND'] == 'redis' and app.config['CACHE_REDIS_URL']:
+        backend = LimitadorRedis(app.config['CACHE_REDIS_URL'])
+    else:
+        backend = LimitadorMemoria()
+    return LimitadorLogin(backend, app.config['LOGIN_JANELA_SEGUNDOS'], app.config['LOGIN_MAX_FALHAS_IP'],
+                          app.config['LOGIN_MAX_FALHAS_USUARIO'], app.config['LOGIN_BLOQUEIO_SEGUNDOS'],
+                          app.config['LOGIN_BLOQUEIO_MAX_SEGUNDOS'])
+
+
+limitador_login = criar_limitador_login()
+portao_hash = threading.BoundedSemaphore(app.config['LOGIN_HASHES_SIMULTANEOS'])
+
+
+def parametros_hash(hash_senha):
+    """'scrypt:32768:8:1$sal$hash' -> 'scrypt:32768:8:1' (método e parâmetros do werkzeug)."""
+    return hash_senha.split('$', 1)[0]
+
+
+@lru_cache(maxsize=None)
+def hash_referencia(metodo):
+    """Hash de uma senha aleatória no método atual: mostra os parâmetros em vigor e é o que se
+    confere quando o usuário não existe — mesmo custo, sem revelar quais usuários existem."""
+    return generate_password_hash(secrets.token_hex(16), method=metodo)
+
+
+def verificar_senha(admin, senha):
+    """Confere a senha dentro do portão de hashes e refaz o hash se o método mudou.
+
+    Devolve True/False, ou None se o portão não abriu em LOGIN_ESPERA_HASH segundos.
+    """
+    if not portao_hash.acquire(timeout=app.config['LOGIN_ESPERA_HASH']):
+        return None
+    try:
+        if admin is None:
+            check_password_hash(hash_referencia(app.config['SENHA_METODO_HASH']), senha)
+            return False
+        if not admin.check_password(senha):
+            return False
+        if admin.precisa_rehash():
+            admin.set_password(senha)
+            db.session.commit()
+        return True
+    finally:
+        portao_hash.release()
+
+
+def login_recusado(status, espera):
+    """Tela de login com 429/503 e Retry-After, para o robô (ou o navegador) esperar."""
+    metricas.incrementar('croche_login_tentativas_total', {'resultado': 'bloqueado' if status == 429 else 'ocupado'})
+    return render_template('admin_login.html'), status, {'Retry-After': str(math.ceil(espera))}
+
+
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if session.get('admin_logged_in'):
@@ -109,9 +1365,22 @@ def admin_login():
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '')
-        admin = AdminUser.query.filter_by(username=username).first()
+        ip = request.remote_addr
+
+        espera = limitador_login.espera(ip, username)
+        if espera:
+            flash(f'Muitas tentativas de login. Tente de novo em {math.ceil(espera)} segundos.', 'error')
+            return login_recusado(429, espera)
 
-        if admin and admin.check_password(password):
+        admin = AdminUser.query.filter_by(username=username).first()
+        senha_ok = verificar_senha(admin, password)
+        if senha_ok is None:
+            flash('O servidor está ocupado. Tente de novo em alguns segundos.', 'error')
+            return login_recusado(503, app.config['LOGIN_ESPERA_HASH'])
+
+        if senha_ok:
+            limitador_login.sucesso(username)
+            metricas.incrementar('croche_login_tentativas_total', {'resultado': 'ok'})
             session.permanent = True
             session['admin_logged_in'] = True
             session['admin_username'] = admin.username
@@ -119,6 +1388,8 @@ def admin_login():
             next_url = request.args.get('next') or url_for('admin_produtos')
             return redirect(next_url)
         else:
+            limitador_login.falha(ip, username)
+            metricas.incrementar('croche_login_tentativas_total', {'resultado': 'falha'})
             flash('Usuário ou senha incorretos.', 'error')
 
     return render_template('admin_login.html')
@@ -140,7 +1411,10 @@ def admin_alterar_senha():
         confirmar = request.form.get('confirmar_senha', '')
         admin = AdminUser.query.filter_by(username=session['admin_username']).first()
 
-        if not admin.check_password(senha_atual):
+        senha_ok = verificar_senha(admin, senha_atual)
+        if senha_ok is None:
+            flash('O servidor está ocupado. Tente de novo em alguns segundos.', 'error')
+        elif not senha_ok:
             flash('Senha atual incorreta.', 'error')
         elif len(nova_senha) < 6:
             flash('A nova senha deve ter pelo menos 6 caracteres.', 'error')
@@ -192,20 +1466,14 @@ def mp_callback():
     redirect_uri = url_for('mp_callback', _external=True)
 
     try:
-        resp = http_requests.post(
-            'https://api.mercadopago.com/oauth/token',
-            json={
-                'client_id':     MP_CLIENT_ID,
-                'client_secret': MP_CLIENT_SECRET,
-                'grant_type':    'authorization_code',
-                'code':          code,
-                'redirect_uri':  redirect_uri,
-            },
-            timeout=10
-        )
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception as e:
+        data = gateway_mp.trocar_codigo_oauth({
+            'client_id':     MP_CLIENT_ID,
+            'client_secret': MP_CLIENT_SECRET,
+            'grant_type':    'authorization_code',
+            'code':          code,
+            'redirect_uri':  redirect_uri,
+        })
+    except ErroGateway as e:
         flash(f'Erro ao obter token do Mercado Pago: {e}', 'error')
         return redirect(url_for('admin_produtos'))
 
@@ -235,8 +1503,10 @@ def mp_callback():
 # ── ROTAS PÚBLICAS ────────────────────────────────────────────────────────────
 
 @app.route('/')
+@leitura_na_replica
 def index():
-    produtos_destaque = Produto.query.limit(6).all()
+    produtos_destaque = catalogo_cache.obter(
+        'destaques', lambda: [produto_para_dict(p) for p in Produto.query.limit(6).all()])
     return render_template('index.html', produtos=produtos_destaque)
 
 
@@ -245,23 +1515,366 @@ def carrinho():
     return render_template('carrinho.html')
 
 
+PRODUTOS_POR_PAGINA = 24
+RESUMO_DESCRICAO = 160  # caracteres da descrição que aparecem no card
+
+# ordem da vitrine -> (rótulo, coluna de ordenação além do id, direção)
+ORDENS_VITRINE = {
+    'recentes': ('Mais recentes', None, 'desc'),
+    'menor_preco': ('Menor preço', Produto.preco, 'asc'),
+    'maior_preco': ('Maior preço', Produto.preco, 'desc'),
+}
+
+
+def decodificar_cursor_vitrine(ordem, cursor):
+    """Cursor "preco_id" (ou só "id" em 'recentes') -> (valor, id); None se inválido."""
+    try:
+        if ORDENS_VITRINE[ordem][1] is None:
+            return None, int(cursor)
+        valor, id_cursor = cursor.rsplit('_', 1)
+        return float(valor), int(id_cursor)
+    except (ValueError, TypeError):
+        return None
+
+
+def codificar_cursor_vitrine(ordem, produto):
+    return str(produto.id) if ORDENS_VITRINE[ordem][1] is None else f'{produto.preco!r}_{produto.id}'
+
+
+def consulta_vitrine(categoria=None, ordem='recentes', cursor=None, por_pagina=PRODUTOS_POR_PAGINA):
+    """Uma página da vitrine por keyset em (coluna da ordem, id) — nunca OFFSET, então a
+    página N custa o mesmo que a 1. A descrição inteira não sai do banco, só o resumo."""
+    _, coluna, direcao = ORDENS_VITRINE[ordem]
+    consulta = (db.session.query(Produto, func.substr(Produto.descricao, 1, RESUMO_DESCRICAO + 1))
+                .options(defer(Produto.descricao)))
+    if categoria:
+        consulta = consulta.filter(Produto.categoria == categoria)
+
+    if cursor:
+        valor, id_cursor = cursor
+        depois_do_id = Produto.id < id_cursor if direcao == 'desc' else Produto.id > id_cursor
+        if coluna is None:
+            consulta = consulta.filter(depois_do_id)
+        else:
+            depois_do_valor = coluna < valor if direcao == 'desc' else coluna > valor
+            consulta = consulta.filter(or_(depois_do_valor, and_(coluna == valor, depois_do_id)))
+
+    colunas = ([coluna] if coluna is not None else []) + [Produto.id]
+    return (consulta
+            .order_by(*[c.desc() if direcao == 'desc' else c.asc() for c in colunas])
+            .limit(por_pagina + 1))
+
+
+def pagina_vitrine(categoria, ordem, cursor):
+    """Página pronta para o cache: cards (HTML da _grade_produtos), dados e o próximo cursor."""
+    linhas = consulta_vitrine(categoria, ordem, cursor).all()
+    proximo_cursor = None
+    if len(linhas) > PRODUTOS_POR_PAGINA:
+        linhas = linhas[:PRODUTOS_POR_PAGINA]
+        proximo_cursor = codificar_cursor_vitrine(ordem, linhas[-1][0])
+    produtos = [produto_para_card(p, resumo) for p, resumo in linhas]
+    return {'produtos': produtos, 'proximo_cursor': proximo_cursor,
+            'html': render_template('_grade_produtos.html', produtos=produtos)}
+
+
+def pagina_vitrine_da_requisicao():
+    """Lê categoria/ordem/cursor da query string e devolve (filtros, página) — do cache, se houver."""
+    categoria = request.args.get('categoria') or None
+    ordem = request.args.get('ordem', 'recentes')
+    if ordem not in ORDENS_VITRINE:
+        ordem = 'recentes'
+    cursor = decodificar_cursor_vitrine(ordem, request.args.get('cursor', ''))
+    # A chave usa o cursor normalizado: lixo na URL não cria entradas novas no cache
+    chave = f'vitrine:{categoria or ""}:{ordem}:{"_".join(map(str, cursor)) if cursor else ""}'
+    pagina = catalogo_cache.obter(chave, lambda: pagina_vitrine(categoria, ordem, cursor))
+    return {'categoria': categoria, 'ordem': ordem}, pagina
+
+
 @app.route('/produtos')
+@leitura_na_replica
 def produtos():
-    categoria = request.args.get('categoria')
-    if categoria:
-        lista_produtos = Produto.query.filter_by(categoria=categoria).all()
-    else:
-        lista_produtos = Produto.query.all()
-    categorias = db.session.query(Produto.categoria).distinct().all()
-    return render_template('produtos.html', produtos=lista_produtos, categorias=categorias)
+    filtros, pagina = pagina_vitrine_da_requisicao()
+    categorias = catalogo_cache.obter(
+        'categorias', lambda: [[c] for (c,) in db.session.query(Produto.categoria).distinct().all()])
+    return render_template('produtos.html', grade_html=pagina['html'], categorias=categorias,
+                           proximo_cursor=pagina['proximo_cursor'], ordens=ORDENS_VITRINE, **filtros)
+
+
+@app.route('/produtos/pagina')
+@leitura_na_replica
+def produtos_pagina():
+    """Próxima página da vitrine em JSON, para a rolagem infinita de produtos.html."""
+    _, pagina = pagina_vitrine_da_requisicao()
+    return jsonify(pagina)
 
 
 @app.route('/produto/<int:id>')
+@leitura_na_replica
 def produto_detalhe(id):
-    produto = Produto.query.get_or_404(id)
+    def carregar():
+        p = db.session.get(Produto, id)
+        return produto_para_dict(p) if p else None
+
+    produto = catalogo_cache.obter(f'produto:{id}', carregar)
+    if produto is None:
+        abort(404)
     return render_template('produto_detalhe.html', produto=produto)
 
 
+BUSCA_POR_PAGINA = 24
+BUSCA_MAX_TERMOS = 8
+
+
+def termos_de_busca(texto):
+    return re.findall(r'\w+', (texto or '').lower())[:BUSCA_MAX_TERMOS]
+
+
+def buscar_produtos(texto, categoria=None, pagina=1, por_pagina=BUSCA_POR_PAGINA, somente_disponiveis=False):
+    """Busca textual ranqueada em nome/descrição/categoria, com contagem por categoria.
+
+    A página de ids e as facetas saem da mesma consulta (CTE + UNION ALL);
+    os produtos da página são carregados depois pela chave primária.
+    SQLite usa a tabela FTS5 `produto_fts` (bm25, nome pesa mais); PostgreSQL,
+    a coluna `busca` (tsvector + GIN). Os termos casam por prefixo ("amigu").
+    """
+    termos = termos_de_busca(texto)
+    vazio = {'produtos': [], 'facetas': [], 'total': 0, 'pagina': pagina, 'por_pagina': por_pagina}
+    if not termos:
+        return vazio
+
+    dialeto = db.engine.dialect.name
+    if dialeto == 'sqlite':
+        origem = """
+            SELECT p.id, p.categoria, bm25(produto_fts, 10.0, 1.0, 2.0) AS rank
+            FROM produto_fts JOIN produto p ON p.id = produto_fts.rowid
+            WHERE produto_fts MATCH :consulta {disponivel}"""
+        consulta = ' '.join(f'"{t}"*' for t in termos)
+    elif dialeto == 'postgresql':
+        origem = """
+            SELECT p.id, p.categoria, -ts_rank(p.busca, q) AS rank
+            FROM produto p, to_tsquery('portuguese', :consulta) q
+            WHERE p.busca @@ q {disponivel}"""
+        consulta = ' & '.join(f'{t}:*' for t in termos)
+    else:
+        # Sem índice textual: LIKE por termo, sem ranking — só para não quebrar em outros bancos
+        condicoes = ' AND '.join(
+            f"(lower(p.nome) LIKE :t{i} OR lower(coalesce(p.descricao, '')) LIKE :t{i})" for i in range(len(termos)))
+        origem = f"SELECT p.id, p.categoria, 0 AS rank FROM produto p WHERE {condicoes} {{disponivel}}"
+        consulta = None
+    origem = origem.format(disponivel='AND p.disponivel = :disponivel' if somente_disponiveis else '')
+
+    sql = db.text(f"""
+        WITH resultados AS ({origem})
+        SELECT * FROM (
+            SELECT 'produto' AS tipo, id, NULL AS categoria, 0 AS quantidade FROM resultados
+            WHERE CAST(:categoria AS VARCHAR(50)) IS NULL OR categoria = :categoria
+            ORDER BY rank, id LIMIT :limite OFFSET :deslocamento
+        ) pagina
+        UNION ALL
+        SELECT 'faceta', NULL, categoria, COUNT(*) FROM resultados GROUP BY categoria
+    """)
+    parametros = {'categoria': categoria or None, 'limite': por_pagina,
+                  'deslocamento': (pagina - 1) * por_pagina, 'disponivel': True}
+    if consulta is None:
+        parametros.update({f't{i}': f'%{t}%' for i, t in enumerate(termos)})
+    else:
+        parametros['consulta'] = consulta
+
+    ids, facetas = [], []
+    for tipo, id_, cat, quantidade in db.session.execute(sql, parametros):
+        if tipo == 'produto':
+            ids.append(id_)
+        else:
+            facetas.append({'categoria': cat, 'quantidade': quantidade})
+    facetas.sort(key=lambda f: (-f['quantidade'], f['categoria'] or ''))
+
+    por_id = {p.id: p for p in Produto.query.filter(Produto.id.in_(ids))} if ids else {}
+    total = sum(f['quantidade'] for f in facetas if not categoria or f['categoria'] == categoria)
+    return dict(vazio, produtos=[produto_para_dict(por_id[i]) for i in ids if i in por_id],
+                facetas=facetas, total=total)
+
+
+@app.route('/busca')
+@leitura_na_replica
+def busca():
+    texto = request.args.get('q', '').strip()
+    categoria = request.args.get('categoria') or None
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+
+    chave = f'busca:{" ".join(termos_de_busca(texto))}:{categoria or ""}:{pagina}'
+    resultado = catalogo_cache.obter(chave, lambda: buscar_produtos(texto, categoria, pagina))
+    grade_html = render_template('_grade_produtos.html', produtos=resultado['produtos'])
+    categorias = catalogo_cache.obter(
+        'categorias', lambda: [[c] for (c,) in db.session.query(Produto.categoria).distinct().all()])
+    return render_template('produtos.html', grade_html=grade_html, categorias=categorias,
+                           busca=texto, busca_categoria=categoria, resultado=resultado,
+                           ultima_pagina=max((resultado['total'] - 1) // resultado['por_pagina'] + 1, 1))
+
+
+CARRINHO_MAX_ITENS = 30
+
+
+def dados_cliente_formulario():
+    """Lê e valida os campos do comprador; devolve None se faltar algo obrigatório."""
+    nome     = request.form.get('nome', '').strip()
+    email    = request.form.get('email', '').strip()
+    telefone = request.form.get('telefone', '').strip()
+    endereco = request.form.get('endereco', '').strip()
+
+    if not all([nome, email, endereco]):
+        return None
+    return {'nome_cliente': nome, 'email': email, 'telefone': telefone, 'endereco': endereco}
+
+
+CHAVE_IDEMPOTENCIA_RE = re.compile(r'[A-Za-z0-9_-]{16,64}')
+
+
+def chave_para_formulario():
+    """Chave de idempotência do formulário: a da URL (nova tentativa do mesmo pedido) ou uma nova."""
+    chave = request.args.get('chave', '')
+    return chave if CHAVE_IDEMPOTENCIA_RE.fullmatch(chave) else secrets.token_urlsafe(24)
+
+
+def chave_idempotencia_enviada():
+    chave = request.form.get('chave_idempotencia', '')
+    return chave if CHAVE_IDEMPOTENCIA_RE.fullmatch(chave) else None
+
+
+def impressao_checkout(cliente, quantidades):
+    """Hash do que foi pedido: o mesmo formulário reenviado gera o mesmo valor."""
+    dados = json.dumps({'cliente': cliente, 'itens': sorted(quantidades.items())}, sort_keys=True)
+    return hashlib.sha256(dados.encode()).hexdigest()
+
+
+def retomar_checkout(chave, impressao, url_formulario, url_formulario_novo):
+    """Reenvio de um formulário já recebido (duplo clique, voltar, nova tentativa):
+    devolve o mesmo pedido em vez de criar outro. None se a chave ainda não foi usada."""
+    pedido = Pedido.query.filter_by(chave_idempotencia=chave).first() if chave else None
+    if pedido is None:
+        return None
+    if pedido.hash_checkout != impressao:
+        flash('Os dados do pedido mudaram desde o primeiro envio. Confira e envie de novo.', 'error')
+        return redirect(url_formulario_novo)
+    if pedido.status_pagamento == 'Aprovado':
+        return redirect(url_for('pagamento_sucesso', pedido_id=pedido.id))
+    return iniciar_pagamento(pedido, url_formulario)
+
+
+def registrar_pedido(pedido, chave, impressao, url_formulario, url_formulario_novo):
+    """Grava o pedido já reservando a criação da preferência (uma transação) e segue para o pagamento."""
+    pedido.chave_idempotencia = chave
+    pedido.hash_checkout = impressao
+    pedido.preferencia_em_criacao = datetime.utcnow() if gateway_mp.configurado else None
+    db.session.add(pedido)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outra requisição com a mesma chave gravou primeiro
+        db.session.rollback()
+        return retomar_checkout(chave, impressao, url_formulario, url_formulario_novo)
+    return iniciar_pagamento(pedido, url_formulario, reservado=True)
+
+
+def espera_preferencia():
+    """Quanto uma criação de preferência pode levar; passado isso, a reserva é considerada abandonada."""
+    return app.config['MP_PRAZO_TOTAL'] + 5
+
+
+def reservar_criacao_preferencia(pedido):
+    """Marca que esta requisição vai chamar o MP para o pedido; False se outra já está chamando."""
+    agora = datetime.utcnow()
+    resultado = db.session.execute(
+        update(Pedido)
+        .where(Pedido.id == pedido.id, Pedido.init_point.is_(None),
+               or_(Pedido.preferencia_em_criacao.is_(None),
+                   Pedido.preferencia_em_criacao < agora - timedelta(seconds=espera_preferencia())))
+        .values(preferencia_em_criacao=agora))
+    db.session.commit()
+    return resultado.rowcount == 1
+
+
+def aguardar_preferencia(pedido):
+    """Espera a requisição que está criando a preferência terminar (com ou sem sucesso)."""
+    limite = time.monotonic() + espera_preferencia()
+    while time.monotonic() < limite:
+        time.sleep(0.25)
+        db.session.rollback()  # encerra a transação para enxergar o commit da outra requisição
+        db.session.refresh(pedido)
+        if pedido.init_point or pedido.preferencia_em_criacao is None:
+            break
+    return pedido
+
+
+def iniciar_pagamento(pedido, url_formulario, reservado=False):
+    """Cria UMA preferência no Mercado Pago com todos os itens do pedido e redireciona.
+    Se ela já existe, reaproveita; se outra requisição está criando, espera por ela."""
+    if not gateway_mp.configurado:
+        flash('Pedido realizado! Entraremos em contato para combinar o pagamento.', 'success')
+        return redirect(url_for('index'))
+
+    if pedido.init_point:
+        return redirect(pedido.init_point)
+    if not reservado and not reservar_criacao_preferencia(pedido):
+        pedido = aguardar_preferencia(pedido)
+        if pedido.init_point:
+            return redirect(pedido.init_point)
+        if not reservar_criacao_preferencia(pedido):
+            flash('Seu pedido ainda está sendo processado. Aguarde alguns segundos e tente de novo.', 'warning')
+            return redirect(url_formulario)
+
+    try:
+        nome_partes  = pedido.nome_cliente.strip().split()
+        payer_first  = nome_partes[0]
+        payer_last   = " ".join(nome_partes[1:]) if len(nome_partes) > 1 else nome_partes[0]
+        expira_em = pedido.data_pedido + timedelta(hours=app.config['PEDIDOS_EXPIRAM_HORAS'])
+        preference_data = {
+            "items": [{
+                "id": str(item.produto_id),
+                "title": item.nome_produto,
+                "description": (item.produto.descricao if item.produto else item.nome_produto)[:255],
+                "category_id": "handcraft",
+                "quantity": item.quantidade,
+                "unit_price": float(item.preco_unitario),
+                "currency_id": "BRL"
+            } for item in pedido.itens],
+            "payer": {
+                "name": payer_first, 
+                "surname": payer_last, 
+                "email": pedido.email
+            },
+            "back_urls": {
+                "success": url_for('pagamento_sucesso', pedido_id=pedido.id, _external=True),
+                "failure": url_for('pagamento_falha', pedido_id=pedido.id, _external=True),
+                "pending": url_for('pagamento_pendente', pedido_id=pedido.id, _external=True)
+            },
+            "auto_return": "approved",
+            "external_reference": str(pedido.id),
+            "statement_descriptor": "CROCHE BY JU", #Aparece na fatura do cartão do comprador — reduz contestações
+            # O link para de aceitar pagamento quando o pedido expira (ver `expirar-pedidos`)
+            "expires": True,
+            "expiration_date_to": expira_em.strftime('%Y-%m-%dT%H:%M:%S.000+00:00'),
+        }
+        preference = gateway_mp.criar_preferencia(preference_data)
+
+        if "id" not in preference:
+            raise ValueError(f"Resposta inesperada do MP: {preference}")
+
+        pedido.preference_id = preference["id"]
+        pedido.init_point = preference.get("init_point") or preference.get("sandbox_init_point")
+        pedido.preferencia_em_criacao = None
+        db.session.commit()
+        return redirect(pedido.init_point)
+
+    except Exception:
+        app.logger.exception('Falha ao criar a preferência do pedido %s', pedido.id)
+        # O pedido fica (a limpeza em lote expira os abandonados); libera a reserva para uma nova tentativa
+        db.session.rollback()
+        pedido.preferencia_em_criacao = None
+        db.session.commit()
+        flash('Erro ao processar pagamento. Tente novamente ou entre em contato.', 'error')
+        return redirect(url_formulario)
+
+
 @app.route('/finalizar-compra', methods=['GET', 'POST'])
 def finalizar_compra():
     if request.method == 'POST':
@@ -283,137 +1896,142 @@ def finalizar_compra():
             return redirect(url_for('produtos'))
 
         # ── 3. Validar campos obrigatórios ────────────────────────────────────
-        nome     = request.form.get('nome', '').strip()
-        email    = request.form.get('email', '').strip()
-        telefone = request.form.get('telefone', '').strip()
-        endereco = request.form.get('endereco', '').strip()
-
-        if not all([nome, email, endereco]):
+        cliente = dados_cliente_formulario()
+        if not cliente:
             flash('Preencha todos os campos obrigatórios.', 'error')
             return redirect(url_for('finalizar_compra'))
 
-        # ── 4. Verificar produto no banco (nunca confiar no cliente) ──────────
-        produto = Produto.query.get(produto_id)
+        # ── 4. Reenvio do mesmo formulário? Devolve o pedido já criado ────────
+        chave = chave_idempotencia_enviada()
+        impressao = impressao_checkout(cliente, {produto_id: quantidade})
+        url_formulario_novo = url_for('finalizar_compra', produto_id=produto_id, quantidade=quantidade)
+        url_formulario = url_for('finalizar_compra', produto_id=produto_id, quantidade=quantidade, chave=chave)
+        resposta = retomar_checkout(chave, impressao, url_formulario, url_formulario_novo)
+        if resposta:
+            return resposta
+
+        # ── 5. Verificar produto no banco (nunca confiar no cliente) ──────────
+        produto = db.session.get(Produto, produto_id)
         if not produto or not produto.disponivel:
             flash('Produto indisponível para encomenda no momento.', 'error')
             return redirect(url_for('produtos'))
 
-        # ── 5. Calcular total server-side (ignorar qualquer valor do cliente) ─
+        # ── 6. Calcular total server-side (ignorar qualquer valor do cliente) ─
         total = produto.preco * quantidade
 
-        # ── 6. Criar pedido APENAS se o Mercado Pago responder OK ─────────────
+        # ── 7. Criar pedido e seguir para o pagamento ─────────────────────────
         pedido = Pedido(
-            nome_cliente=nome,
-            email=email,
-            telefone=telefone,
-            endereco=endereco,
+            **cliente,
             produto_id=produto_id,
             quantidade=quantidade,
-            total=total
+            total=total,
+            itens=[ItemPedido(produto=produto, nome_produto=produto.nome,
+                              quantidade=quantidade, preco_unitario=produto.preco)]
         )
-        db.session.add(pedido)
-        db.session.commit()
+        return registrar_pedido(pedido, chave, impressao, url_formulario, url_formulario_novo)
+
+    return render_template('finalizar_compra.html', carrinho=False, chave_idempotencia=chave_para_formulario())
+
+
+@app.route('/finalizar-compra/carrinho', methods=['GET', 'POST'])
+def finalizar_compra_carrinho():
+    """Checkout do carrinho inteiro: um pedido, N itens, uma preferência no MP."""
+    if request.method == 'POST':
+
+        # ── 1. Validar itens do carrinho ({id, quantidade}) ───────────────────
+        quantidades = {}
+        try:
+            for item in json.loads(request.form.get('itens', '[]')):
+                produto_id = int(item['id'])
+                quantidade = int(item['quantidade'])
+                if quantidade < 1 or quantidade > 99:
+                    raise ValueError
+                quantidades[produto_id] = min(quantidades.get(produto_id, 0) + quantidade, 99)
+        except (ValueError, TypeError, KeyError):
+            flash('Carrinho inválido. Quantidades permitidas entre 1 e 99.', 'error')
+            return redirect(url_for('carrinho'))
+
+        if not quantidades or len(quantidades) > CARRINHO_MAX_ITENS:
+            flash(f'O carrinho deve ter entre 1 e {CARRINHO_MAX_ITENS} produtos.', 'error')
+            return redirect(url_for('carrinho'))
+
+        # ── 2. Validar campos obrigatórios ────────────────────────────────────
+        cliente = dados_cliente_formulario()
+        if not cliente:
+            flash('Preencha todos os campos obrigatórios.', 'error')
+            return redirect(url_for('finalizar_compra_carrinho'))
+
+        # ── 3. Reenvio do mesmo formulário? Devolve o pedido já criado ────────
+        chave = chave_idempotencia_enviada()
+        impressao = impressao_checkout(cliente, quantidades)
+        url_formulario_novo = url_for('finalizar_compra_carrinho')
+        url_formulario = url_for('finalizar_compra_carrinho', chave=chave)
+        resposta = retomar_checkout(chave, impressao, url_formulario, url_formulario_novo)
+        if resposta:
+            return resposta
+
+        # ── 4. Carregar todos os produtos numa única consulta ─────────────────
+        produtos = (Produto.query
+                    .filter(Produto.id.in_(quantidades), Produto.disponivel.is_(True))
+                    .order_by(Produto.id).all())
+        if len(produtos) != len(quantidades):
+            flash('Algum produto do carrinho está indisponível no momento. Revise seu carrinho.', 'error')
+            return redirect(url_for('carrinho'))
+
+        # ── 5. Calcular total server-side e criar o pedido ────────────────────
+        itens = [ItemPedido(produto=p, nome_produto=p.nome, quantidade=quantidades[p.id],
+                            preco_unitario=p.preco) for p in produtos]
+        pedido = Pedido(
+            **cliente,
+            quantidade=sum(i.quantidade for i in itens),
+            total=sum(i.subtotal for i in itens),
+            itens=itens
+        )
+        return registrar_pedido(pedido, chave, impressao, url_formulario, url_formulario_novo)
+
+    return render_template('finalizar_compra.html', carrinho=True, chave_idempotencia=chave_para_formulario())
 
-        if sdk and MERCADOPAGO_ACCESS_TOKEN:
-            try:
-                nome_partes  = nome.strip().split()
-                payer_first  = nome_partes[0]
-                payer_last   = " ".join(nome_partes[1:]) if len(nome_partes) > 1 else nome_partes[0]
-                preference_data = {
-                    "items": [{
-                        "id": str(produto.id),
-                        "title": produto.nome,
-                        "description": produto.descricao[:255],
-                        "category_id": "handcraft",
-                        "quantity": quantidade,
-                        "unit_price": float(produto.preco),
-                        "currency_id": "BRL"
-                    }],
-                    "payer": {
-                        "name": payer_first, 
-                        "surname": payer_last, 
-                        "email": email
-                    },
-                    "back_urls": {
-                        "success": url_for('pagamento_sucesso', pedido_id=pedido.id, _external=True),
-                        "failure": url_for('pagamento_falha', pedido_id=pedido.id, _external=True),
-                        "pending": url_for('pagamento_pendente', pedido_id=pedido.id, _external=True)
-                    },
-                    "auto_return": "approved",
-                    "external_reference": str(pedido.id),
-                    "statement_descriptor": "CROCHE BY JU" #Aparece na fatura do cartão do comprador — reduz contestações
-                }
-                preference_response = sdk.preference().create(preference_data)
-                preference = preference_response.get("response", preference_response)
-
-                if "id" not in preference:
-                    raise ValueError(f"Resposta inesperada do MP: {preference}")
-
-                pedido.preference_id = preference["id"]
-                db.session.commit()
-
-                init_point = preference.get("init_point") or preference.get("sandbox_init_point")
-                return redirect(init_point)
-
-            except Exception as e:
-                import traceback; traceback.print_exc()
-                # Mercado Pago falhou — remove o pedido para não poluir o banco
-                db.session.delete(pedido)
-                db.session.commit()
-                flash('Erro ao processar pagamento. Tente novamente ou entre em contato.', 'error')
-                return redirect(url_for('produtos'))
-        else:
-            flash('Pedido realizado! Entraremos em contato para combinar o pagamento.', 'success')
-            return redirect(url_for('index'))
 
-    return render_template('finalizar_compra.html')
+def exibir_resultado_pagamento(pedido_id, status):
+    """Só lê o pedido: o status é gravado pelo webhook e pelo `reconciliar-pagamentos`,
+    com a resposta do próprio MP — nunca pela URL de retorno, que qualquer um pode abrir."""
+    pedido = Pedido.query.get_or_404(pedido_id)
+    if pedido.status_pagamento == 'Aprovado':
+        status = 'sucesso'
+    return render_template('pagamento_resultado.html', status=status, pedido=pedido)
 
 
 @app.route('/pagamento/sucesso/<int:pedido_id>')
 def pagamento_sucesso(pedido_id):
-    pedido = Pedido.query.get_or_404(pedido_id)
-    pedido.status_pagamento = 'Aprovado'; pedido.status = 'Confirmado'
-    db.session.commit()
-    return render_template('pagamento_resultado.html', status='sucesso', pedido=pedido)
+    return exibir_resultado_pagamento(pedido_id, 'sucesso')
 
 
 @app.route('/pagamento/falha/<int:pedido_id>')
 def pagamento_falha(pedido_id):
-    pedido = Pedido.query.get_or_404(pedido_id)
-    pedido.status_pagamento = 'Rejeitado'; db.session.commit()
-    return render_template('pagamento_resultado.html', status='falha', pedido=pedido)
+    return exibir_resultado_pagamento(pedido_id, 'falha')
 
 
 @app.route('/pagamento/pendente/<int:pedido_id>')
 def pagamento_pendente(pedido_id):
-    pedido = Pedido.query.get_or_404(pedido_id)
-    pedido.status_pagamento = 'Pendente'; db.session.commit()
-    return render_template('pagamento_resultado.html', status='pendente', pedido=pedido)
+    return exibir_resultado_pagamento(pedido_id, 'pendente')
 
 
 @app.route('/webhook/mercadopago', methods=['POST'])
 def webhook_mercadopago():
-    try:
-        data = request.get_json()
-        if data.get('type') == 'payment':
-            payment_id = data['data']['id']
-            payment = sdk.payment().get(payment_id)["response"]
-            pedido_id = payment.get('external_reference')
-            if pedido_id:
-                pedido = Pedido.query.get(int(pedido_id))
-                if pedido:
-                    pedido.payment_id = str(payment_id)
-                    if payment['status'] == 'approved':
-                        pedido.status_pagamento = 'Aprovado'; pedido.status = 'Confirmado'
-                    elif payment['status'] == 'rejected':
-                        pedido.status_pagamento = 'Rejeitado'
-                    else:
-                        pedido.status_pagamento = 'Pendente'
-                    db.session.commit()
-        return jsonify({'status': 'ok'}), 200
-    except Exception as e:
-        print(f"Erro no webhook: {e}")
-        return jsonify({'status': 'error'}), 500
+    """Só grava o evento na caixa de entrada e responde 200 — o processamento é em lote."""
+    data = request.get_json(silent=True) or {}
+    tipo = data.get('type') or request.args.get('type') or request.args.get('topic')
+    recurso_id = ((data.get('data') or {}).get('id')
+                  or request.args.get('data.id') or request.args.get('id'))
+    if not tipo or not recurso_id:
+        return jsonify({'status': 'ignorado'}), 200
+
+    # Sempre grava: um evento pendente pode já estar sendo processado com um status velho
+    # (ex.: 'approved' chegando depois de 'pending'). As repetições se juntam no lote.
+    db.session.add(EventoWebhook(tipo=tipo, recurso_id=str(recurso_id),
+                                 payload=request.get_data(as_text=True)[:10000]))
+    db.session.commit()
+    return jsonify({'status': 'ok'}), 200
 
 
 # ── ADMIN — PROTEGIDO ─────────────────────────────────────────────────────────
@@ -442,7 +2060,15 @@ def criar_produto():
             categoria=request.form.get('categoria'),
             disponivel=request.form.get('disponivel') == 'on'
         )
+        try:
+            imagem_hash = aplicar_upload_imagem(produto)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return render_template('form_produto.html', produto=produto)
         db.session.add(produto); db.session.commit()
+        if imagem_hash:
+            agendar_processamento_imagem(produto.id, imagem_hash)
+        catalogo_cache.invalidar()
         flash('Produto criado com sucesso!', 'success')
         return redirect(url_for('admin_produtos'))
     return render_template('form_produto.html', produto=None)
@@ -460,7 +2086,18 @@ def editar_produto(id):
         produto.prazo_dias = int(request.form.get('prazo_dias', 7))
         produto.categoria = request.form.get('categoria')
         produto.disponivel = request.form.get('disponivel') == 'on'
+        if request.form.get('remover_imagem') == 'on':
+            produto.imagem_hash = produto.imagem_larguras = None
+        try:
+            imagem_hash = aplicar_upload_imagem(produto)
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('editar_produto', id=id))
         db.session.commit()
+        if imagem_hash:
+            agendar_processamento_imagem(produto.id, imagem_hash)
+        catalogo_cache.invalidar()
         flash('Produto atualizado com sucesso!', 'success')
         return redirect(url_for('admin_produtos'))
     return render_template('form_produto.html', produto=produto)
@@ -470,16 +2107,401 @@ def editar_produto(id):
 @login_required
 def deletar_produto(id):
     produto = Produto.query.get_or_404(id)
+    # Também pelo ORM: o SQLite só aplica o ON DELETE SET NULL com foreign_keys ligado, e um
+    # id solto poderia acabar apontando para o próximo produto criado
+    ItemPedido.query.filter_by(produto_id=produto.id).update({'produto_id': None}, synchronize_session=False)
     db.session.delete(produto); db.session.commit()
+    catalogo_cache.invalidar()
     flash('Produto deletado com sucesso!', 'success')
     return redirect(url_for('admin_produtos'))
 
 
+IMPORTACAO_LOTE = 500
+IMPORTACAO_MAX_ERROS_EXIBIDOS = 200
+
+
+def normalizar_cabecalho(valor):
+    """'Descrição ' -> 'descricao' — aceita cabeçalhos com acento e maiúsculas."""
+    texto = unicodedata.normalize('NFKD', str(valor or '')).encode('ascii', 'ignore').decode()
+    return texto.strip().lower().replace(' ', '_')
+
+
+def ler_planilha_produtos(arquivo, nome_arquivo):
+    """Gera (número da linha, {coluna: valor}) de um XLSX ou CSV, lendo em streaming.
+
+    Arquivo ilegível vira ValueError com uma mensagem para a admin, como os demais erros.
+    """
+    if nome_arquivo.lower().endswith('.xlsx'):
+        try:
+            wb = load_workbook(arquivo, read_only=True, data_only=True)
+        except (BadZipFile, InvalidFileException, KeyError):  # KeyError: zip que não é uma planilha
+            raise ValueError('Planilha inválida ou corrompida.') from None
+        linhas = wb.active.iter_rows(values_only=True)
+    elif not nome_arquivo.lower().endswith('.csv'):
+        raise ValueError('Envie um arquivo .xlsx ou .csv.')
+
+    try:
+        if nome_arquivo.lower().endswith('.csv'):
+            texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+            primeira = texto.readline()
+            texto.seek(0)
+            delimitador = ';' if primeira.count(';') > primeira.count(',') else ','  # Excel pt-BR usa ';'
+            linhas = csv.reader(texto, delimiter=delimitador)
+
+        cabecalho = [normalizar_cabecalho(c) for c in next(linhas, [])]
+        if 'nome' not in cabecalho:
+            raise ValueError('A primeira linha precisa ter os cabeçalhos (ao menos "nome").')
+        for numero, valores in enumerate(linhas, start=2):
+            if all(v is None or str(v).strip() == '' for v in valores):
+                continue
+            yield numero, dict(zip(cabecalho, valores))
+    except UnicodeDecodeError:
+        raise ValueError('O CSV precisa estar em UTF-8 (no Excel, salve como "CSV UTF-8").') from None
+    except csv.Error:
+        raise ValueError('CSV inválido ou corrompido.') from None
+
+
+def validar_linha_produto(valores):
+    """Converte uma linha da planilha em colunas de Produto; devolve (dados, erro)."""
+    def texto(coluna):
+        valor = valores.get(coluna)
+        return '' if valor is None else str(valor).strip()
+
+    dados = {'nome': texto('nome'), 'descricao': texto('descricao'),
+             'imagem_url': texto('imagem_url') or None, 'categoria': texto('categoria') or None}
+    if not dados['nome']:
+        return None, 'nome é obrigatório'
+    if len(dados['nome']) > 100:
+        return None, 'nome com mais de 100 caracteres'
+    if not dados['descricao']:
+        return None, 'descrição é obrigatória'
+    if dados['categoria'] and len(dados['categoria']) > 50:
+        return None, 'categoria com mais de 50 caracteres'
+    if dados['imagem_url'] and len(dados['imagem_url']) > 200:
+        return None, 'imagem_url com mais de 200 caracteres'
+
+    try:
+        preco = valores.get('preco')
+        if not isinstance(preco, (int, float)):
+            preco = texto('preco').replace('R$', '').strip()
+            if ',' in preco:
+                preco = preco.replace('.', '').replace(',', '.')  # 1.234,56 -> 1234.56
+        dados['preco'] = float(preco)
+        if dados['preco'] < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return None, f'preço inválido: {texto("preco")!r}'
+
+    try:
+        dados['prazo_dias'] = int(float(texto('prazo_dias'))) if texto('prazo_dias') else 7
+        if dados['prazo_dias'] < 1:
+            raise ValueError
+    except ValueError:
+        return None, f'prazo_dias inválido: {texto("prazo_dias")!r}'
+
+    disponivel = valores.get('disponivel')
+    if isinstance(disponivel, bool):
+        dados['disponivel'] = disponivel
+    else:
+        dados['disponivel'] = normalizar_cabecalho(disponivel) not in ('0', 'false', 'nao', 'n', 'no', 'indisponivel')
+
+    if texto('id'):
+        try:
+            dados['id'] = int(float(texto('id')))
+        except ValueError:
+            return None, f'id inválido: {texto("id")!r}'
+    return dados, None
+
+
+def gravar_lote_produtos(lote, relatorio):
+    """Upsert de um lote: um SELECT por chave, um UPDATE em massa e um INSERT em massa."""
+    ids = {d['id'] for _, d in lote if 'id' in d}
+    nomes = {d['nome'] for _, d in lote if 'id' not in d}
+    ids_existentes = {i for (i,) in db.session.query(Produto.id).filter(Produto.id.in_(ids))} if ids else set()
+    id_por_nome = {}
+    if nomes:
+        for nome, produto_id in (db.session.query(Produto.nome, func.min(Produto.id))
+                                 .filter(Produto.nome.in_(nomes)).group_by(Produto.nome)):
+            id_por_nome[nome] = produto_id
+
+    atualizacoes, insercoes = {}, {}
+    for numero, dados in lote:
+        if 'id' in dados:
+            if dados['id'] not in ids_existentes:
+                relatorio['erros'].append((numero, f'produto id {dados["id"]} não existe'))
+                continue
+            atualizacoes[dados['id']] = dados
+        elif dados['nome'] in id_por_nome:
+            atualizacoes[id_por_nome[dados['nome']]] = dict(dados, id=id_por_nome[dados['nome']])
+        else:
+            insercoes[dados['nome']] = dados  # nome repetido na planilha: vale a última linha
+
+    if atualizacoes:
+        db.session.execute(update(Produto), list(atualizacoes.values()))
+    if insercoes:
+        db.session.execute(insert(Produto), list(insercoes.values()))
+    relatorio['atualizados'] += len(atualizacoes)
+    relatorio['inseridos'] += len(insercoes)
+
+
+def importar_produtos(linhas, simular=False):
+    """Valida e grava as linhas em lotes, numa única transação; `simular` desfaz tudo no fim."""
+    relatorio = {'linhas': 0, 'inseridos': 0, 'atualizados': 0, 'erros': [], 'simulacao': simular}
+    lote = []
+    for numero, valores in linhas:
+        relatorio['linhas'] += 1
+        dados, erro = validar_linha_produto(valores)
+        if erro:
+            relatorio['erros'].append((numero, erro))
+            continue
+        lote.append((numero, dados))
+        if len(lote) >= IMPORTACAO_LOTE:
+            gravar_lote_produtos(lote, relatorio)
+            lote = []
+    if lote:
+        gravar_lote_produtos(lote, relatorio)
+
+    if simular:
+        db.session.rollback()
+    else:
+        db.session.commit()
+        catalogo_cache.invalidar()
+    relatorio['erros'].sort()
+    return relatorio
+
+
+@app.route('/admin/produtos/importar', methods=['GET', 'POST'])
+@login_required
+def importar_produtos_planilha():
+    relatorio = None
+    if request.method == 'POST':
+        arquivo = request.files.get('arquivo')
+        if not arquivo or not arquivo.filename:
+            flash('Selecione uma planilha .xlsx ou .csv.', 'error')
+            return redirect(url_for('importar_produtos_planilha'))
+        try:
+            relatorio = importar_produtos(ler_planilha_produtos(arquivo.stream, arquivo.filename),
+                                          simular=request.form.get('simular') == 'on')
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('importar_produtos_planilha'))
+    return render_template('admin_importar_produtos.html', relatorio=relatorio,
+                           max_erros=IMPORTACAO_MAX_ERROS_EXIBIDOS)
+
+
+@app.route('/admin/cache')
+@login_required
+def admin_cache_stats():
+    return jsonify(catalogo_cache.stats())
+
+
+@app.route('/admin/gateway')
+@login_required
+def admin_gateway_stats():
+    return jsonify(gateway_mp.stats())
+
+
+@app.route('/metrics')
+def metrics():
+    """Métricas no formato do Prometheus; aceita `Authorization: Bearer $METRICS_TOKEN` ou sessão de admin."""
+    token = app.config['METRICS_TOKEN']
+    autorizado = session.get('admin_logged_in') or (
+        token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'))
+    if not autorizado:
+        abort(401)
+
+    cache = catalogo_cache.stats()
+    gateway = gateway_mp.stats()
+    pendentes = db.session.query(func.count(EventoWebhook.id)).filter(EventoWebhook.processado_em.is_(None)).scalar()
+    extras = [
+        ('croche_cache_catalogo_hits_total', 'counter', 'Leituras do cache do catálogo encontradas.',
+         [({}, cache['hits'])]),
+        ('croche_cache_catalogo_misses_total', 'counter', 'Leituras do cache do catálogo que foram ao banco.',
+         [({}, cache['misses'])]),
+        ('croche_mp_disjuntor_aberto', 'gauge', '1 se o disjuntor do Mercado Pago está aberto ou meio-aberto.',
+         [({}, int(gateway['disjuntor'] != 'fechado'))]),
+        ('croche_mp_falhas_seguidas', 'gauge', 'Falhas seguidas nas chamadas ao Mercado Pago.',
+         [({}, gateway['falhas_seguidas'])]),
+        ('croche_webhooks_pendentes', 'gauge', 'Eventos de webhook aguardando processamento.', [({}, pendentes)]),
+    ]
+    return Response(metricas.exportar(extras), mimetype='text/plain; version=0.0.4')
+
+
+PEDIDOS_POR_PAGINA = 50
+
+
+def pedido_para_dict(pedido):
+    return {
+        'id': pedido.id,
+        'nome_cliente': pedido.nome_cliente,
+        'email': pedido.email,
+        'telefone': pedido.telefone,
+        'endereco': pedido.endereco,
+        'quantidade': pedido.quantidade,
+        'total': pedido.total,
+        'status': pedido.status,
+        'status_pagamento': pedido.status_pagamento,
+        'data_pedido': pedido.data_pedido.strftime('%d/%m/%Y'),
+        'produto': {'nome': pedido.resumo_itens},
+        'itens': [{'nome': i.nome_produto, 'quantidade': i.quantidade,
+                   'preco_unitario': i.preco_unitario, 'subtotal': i.subtotal}
+                  for i in pedido.itens],
+    }
+
+
+def filtrar_pedidos(consulta, args):
+    """Aplica os filtros da listagem de pedidos (status, pagamento, período e busca)."""
+    if args.get('status'):
+        consulta = consulta.filter(Pedido.status == args['status'])
+    if args.get('status_pagamento'):
+        consulta = consulta.filter(Pedido.status_pagamento == args['status_pagamento'])
+    try:
+        if args.get('de'):
+            consulta = consulta.filter(Pedido.data_pedido >= datetime.strptime(args['de'], '%Y-%m-%d'))
+        if args.get('ate'):
+            ate = datetime.strptime(args['ate'], '%Y-%m-%d') + timedelta(days=1)
+            consulta = consulta.filter(Pedido.data_pedido < ate)
+    except ValueError:
+        pass  # data mal formada — ignora o filtro em vez de quebrar a página
+    busca = (args.get('q') or '').strip()
+    if busca:
+        termo = f'%{busca}%'
+        condicoes = [Pedido.nome_cliente.ilike(termo), Pedido.email.ilike(termo)]
+        if busca.lstrip('#').isdigit():
+            condicoes.append(Pedido.id == int(busca.lstrip('#')))
+        consulta = consulta.filter(or_(*condicoes))
+    return consulta
+
+
+def decodificar_cursor(cursor):
+    """Cursor de paginação no formato '<data_pedido ISO>_<id>'."""
+    try:
+        data_iso, _, pedido_id = cursor.rpartition('_')
+        return datetime.fromisoformat(data_iso), int(pedido_id)
+    except (ValueError, AttributeError):
+        return None
+
+
 @app.route('/admin/pedidos')
 @login_required
 def admin_pedidos():
-    pedidos = Pedido.query.order_by(Pedido.data_pedido.desc()).all()
-    return render_template('admin_pedidos.html', pedidos=pedidos)
+    consulta = filtrar_pedidos(Pedido.query, request.args)
+
+    # Paginação por cursor (keyset): nunca usa OFFSET, então a página N custa o mesmo que a 1
+    cursor = decodificar_cursor(request.args.get('cursor', ''))
+    if cursor:
+        data_cursor, id_cursor = cursor
+        consulta = consulta.filter(or_(
+            Pedido.data_pedido < data_cursor,
+            and_(Pedido.data_pedido == data_cursor, Pedido.id < id_cursor),
+        ))
+
+    pedidos = (consulta
+               .options(joinedload(Pedido.produto), selectinload(Pedido.itens), defer(Pedido.endereco))
+               .order_by(Pedido.data_pedido.desc(), Pedido.id.desc())
+               .limit(PEDIDOS_POR_PAGINA + 1)
+               .all())
+
+    proximo_cursor = None
+    if len(pedidos) > PEDIDOS_POR_PAGINA:
+        pedidos = pedidos[:PEDIDOS_POR_PAGINA]
+        ultimo = pedidos[-1]
+        proximo_cursor = f'{ultimo.data_pedido.isoformat()}_{ultimo.id}'
+
+    contagem_status = dict(db.session.query(Pedido.status, func.count(Pedido.id))
+                           .group_by(Pedido.status).all())
+    filtros = {k: request.args.get(k, '') for k in ('status', 'status_pagamento', 'de', 'ate', 'q')}
+
+    return render_template('admin_pedidos.html', pedidos=pedidos, proximo_cursor=proximo_cursor,
+                           contagem_status=contagem_status, filtros=filtros,
+                           primeira_pagina=not cursor)
+
+
+@app.route('/admin/pedido/<int:id>.json')
+@login_required
+def admin_pedido_json(id):
+    pedido = (Pedido.query.options(joinedload(Pedido.produto), selectinload(Pedido.itens))
+              .filter_by(id=id).first_or_404())
+    return jsonify(pedido_para_dict(pedido))
+
+
+EXPORT_COLUNAS = ['ID', 'Data', 'Cliente', 'E-mail', 'Telefone', 'Endereço', 'Itens', 'Quantidade',
+                  'Total', 'Status', 'Pagamento', 'Payment ID', 'Preference ID']
+# Nome, endereço etc. vêm do checkout público: texto começando com estes caracteres o Excel
+# (e o LibreOffice) executaria como fórmula ao abrir a exportação
+PREFIXOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def texto_csv_seguro(valor):
+    """Prefixa com ' o texto que a planilha leria como fórmula (ex.: =HYPERLINK(...))."""
+    if isinstance(valor, str) and valor.startswith(PREFIXOS_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def celulas_xlsx(planilha, linha):
+    """Células do XLSX com todo texto gravado como texto — o openpyxl transformaria
+    qualquer string começando com '=' numa fórmula."""
+    celulas = []
+    for valor in linha:
+        celula = WriteOnlyCell(planilha, value=valor)
+        if isinstance(valor, str):
+            celula.data_type = 's'
+        celulas.append(celula)
+    return celulas
+
+
+def linhas_exportacao(args):
+    """Gera as linhas dos pedidos filtrados lendo do banco em blocos (yield_per), sem carregar tudo."""
+    consulta = (filtrar_pedidos(Pedido.query, args)
+                .options(selectinload(Pedido.produto), selectinload(Pedido.itens))
+                .order_by(Pedido.data_pedido.desc(), Pedido.id.desc())
+                .yield_per(500))
+    for p in consulta:
+        yield [p.id, p.data_pedido, p.nome_cliente, p.email, p.telefone, p.endereco, p.resumo_itens,
+               p.quantidade, p.total, p.status, p.status_pagamento, p.payment_id, p.preference_id]
+
+
+@app.route('/admin/pedidos/export')
+@login_required
+def exportar_pedidos():
+    formato = request.args.get('format', 'csv')
+    nome_arquivo = f'pedidos-{datetime.now():%Y%m%d-%H%M}'
+
+    if formato == 'csv':
+        def gerar():
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            buffer.write('\ufeff')  # BOM — o Excel abre os acentos corretamente
+            escritor.writerow(EXPORT_COLUNAS)
+            for i, linha in enumerate(linhas_exportacao(request.args), 1):
+                linha[1] = linha[1].strftime('%d/%m/%Y %H:%M') if linha[1] else ''
+                escritor.writerow([texto_csv_seguro(v) for v in linha])
+                if i % 500 == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0); buffer.truncate()
+            yield buffer.getvalue()
+
+        return Response(stream_with_context(gerar()), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}.csv'})
+
+    if formato == 'xlsx':
+        # Não é streaming como o CSV: o .xlsx é um zip com o índice no fim, então a resposta
+        # só começa depois de o arquivo inteiro ficar pronto. O workbook write-only grava as
+        # linhas num arquivo temporário à medida que chegam, então a memória não cresce.
+        wb = Workbook(write_only=True)
+        planilha = wb.create_sheet('Pedidos')
+        planilha.append(EXPORT_COLUNAS)
+        for linha in linhas_exportacao(request.args):
+            planilha.append(celulas_xlsx(planilha, linha))
+        arquivo = tempfile.TemporaryFile()
+        wb.save(arquivo)
+        arquivo.seek(0)
+        return send_file(arquivo, as_attachment=True, download_name=f'{nome_arquivo}.xlsx',
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    abort(400, description='Formato inválido: use csv ou xlsx.')
 
 
 @app.route('/admin/pedido/<int:id>/status/<status>')
@@ -493,13 +2515,665 @@ def alterar_status_pedido(id, status):
 
 # ── API ───────────────────────────────────────────────────────────────────────
 
+# Campos que a API pública pode devolver; `campos=` na query string escolhe um subconjunto
+API_CAMPOS_PRODUTO = ('id', 'nome', 'preco', 'prazo_dias', 'disponivel', 'categoria', 'imagem_url', 'descricao')
+API_CAMPOS_PADRAO = ('id', 'nome', 'preco', 'prazo_dias', 'disponivel')
+API_POR_PAGINA_MAX = 100
+
+
+def resposta_json_catalogo(nome, carregar):
+    """Serve JSON do catálogo a partir do cache, com ETag forte e GET condicional (304).
+
+    O corpo já serializado e a ETag (derivada da versão do catálogo + conteúdo)
+    ficam no cache, então um 304 não custa consulta nem encoding de JSON.
+    """
+    def montar():
+        dados = carregar()
+        if dados is None:
+            return None
+        corpo = json.dumps(dados, ensure_ascii=False, separators=(',', ':'))
+        etag = hashlib.sha1(f'{catalogo_cache.versao()}:{corpo}'.encode()).hexdigest()
+        return {'corpo': corpo, 'etag': etag}
+
+    entrada = catalogo_cache.obter(nome, montar)
+    if entrada is None:
+        abort(404)
+    resp = app.response_class(entrada['corpo'], mimetype='application/json')
+    resp.set_etag(entrada['etag'])
+    resp.headers['Cache-Control'] = 'no-cache'  # o navegador sempre revalida, mas o 304 é barato
+    return resp.make_conditional(request)
+
+
+def campos_solicitados():
+    pedidos = request.args.get('campos')
+    if not pedidos:
+        return API_CAMPOS_PADRAO
+    campos = [c for c in API_CAMPOS_PRODUTO if c in {p.strip() for p in pedidos.split(',')}]
+    if not campos:
+        abort(400, description='Nenhum campo válido em "campos".')
+    if 'id' not in campos:
+        campos.insert(0, 'id')
+    return tuple(campos)
+
+
 @app.route('/api/produtos')
+@leitura_na_replica
 def api_produtos():
     # Retorna apenas produtos disponíveis — nunca expor indisponíveis publicamente
-    produtos = Produto.query.filter_by(disponivel=True).all()
-    return jsonify([{'id': p.id, 'nome': p.nome, 'preco': p.preco,
-                     'prazo_dias': p.prazo_dias, 'disponivel': p.disponivel}
-                    for p in produtos])
+    campos = campos_solicitados()
+    if 'pagina' not in request.args and 'por_pagina' not in request.args:
+        # Sem paginação pedida, mantém o formato original (lista com todos) para clientes antigos
+        def carregar_lista():
+            linhas = (Produto.query.filter_by(disponivel=True).order_by(Produto.id)
+                      .with_entities(*[getattr(Produto, c) for c in campos]).all())
+            return [dict(zip(campos, linha)) for linha in linhas]
+
+        return resposta_json_catalogo(f'api_produtos:{",".join(campos)}:todos', carregar_lista)
+
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = min(max(request.args.get('por_pagina', 50, type=int), 1), API_POR_PAGINA_MAX)
+
+    def carregar():
+        colunas = [getattr(Produto, c) for c in campos]
+        consulta = Produto.query.filter_by(disponivel=True)
+        total = consulta.count()
+        linhas = (consulta.order_by(Produto.id)
+                  .with_entities(*colunas)
+                  .offset((pagina - 1) * por_pagina).limit(por_pagina).all())
+        return {
+            'produtos': [dict(zip(campos, linha)) for linha in linhas],
+            'pagina': pagina,
+            'por_pagina': por_pagina,
+            'total': total,
+            'proxima': pagina + 1 if pagina * por_pagina < total else None,
+        }
+
+    return resposta_json_catalogo(f'api_produtos:{",".join(campos)}:{pagina}:{por_pagina}', carregar)
+
+
+@app.route('/api/produtos/<int:id>')
+@leitura_na_replica
+def api_produto(id):
+    campos = campos_solicitados()
+
+    def carregar():
+        colunas = [getattr(Produto, c) for c in campos]
+        linha = (Produto.query.filter_by(id=id, disponivel=True)
+                 .with_entities(*colunas).first())
+        return dict(zip(campos, linha)) if linha else None
+
+    return resposta_json_catalogo(f'api_produto:{id}:{",".join(campos)}', carregar)
+
+
+@app.route('/api/busca')
+@leitura_na_replica
+def api_busca():
+    texto = request.args.get('q', '').strip()
+    categoria = request.args.get('categoria') or None
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = min(max(request.args.get('por_pagina', BUSCA_POR_PAGINA, type=int), 1), API_POR_PAGINA_MAX)
+
+    def carregar():
+        resultado = buscar_produtos(texto, categoria, pagina, por_pagina, somente_disponiveis=True)
+        resultado['proxima'] = pagina + 1 if pagina * por_pagina < resultado['total'] else None
+        return resultado
+
+    termos = ' '.join(termos_de_busca(texto))
+    return resposta_json_catalogo(f'api_busca:{termos}:{categoria or ""}:{pagina}:{por_pagina}', carregar)
+
+
+# ── PROCESSAMENTO DE WEBHOOKS ─────────────────────────────────────────────────
+
+WEBHOOK_MAX_TENTATIVAS = 5
+
+
+def aplicar_status_pagamento(pedido, status_mp, payment_id=None):
+    """Traduz o status do Mercado Pago para o pedido."""
+    if payment_id:
+        pedido.payment_id = str(payment_id)
+    if status_mp == 'approved':
+        pedido.status_pagamento = 'Aprovado'; pedido.status = 'Confirmado'
+    elif status_mp in ('rejected', 'cancelled'):
+        pedido.status_pagamento = 'Rejeitado'
+    else:
+        pedido.status_pagamento = 'Pendente'
+
+
+def processar_lote_webhooks(tamanho_lote=100):
+    """Processa um lote da caixa de entrada numa única transação; devolve quantos eventos saíram da fila."""
+    eventos = (EventoWebhook.query
+               .filter(EventoWebhook.processado_em.is_(None))
+               .order_by(EventoWebhook.id)
+               .limit(tamanho_lote)
+               .with_for_update(skip_locked=True)
+               .all())
+    if not eventos:
+        return 0
+
+    # Repetições do mesmo recurso que ficaram fora do LIMIT saem junto: todas chegaram antes
+    # da consulta ao MP logo abaixo, então o status que ela trouxer vale para elas também.
+    # O que chegar depois fica na fila e ganha uma consulta nova no próximo lote.
+    eventos += (EventoWebhook.query
+                .filter(EventoWebhook.processado_em.is_(None),
+                        tuple_(EventoWebhook.tipo, EventoWebhook.recurso_id)
+                        .in_({(e.tipo, e.recurso_id) for e in eventos}),
+                        EventoWebhook.id > eventos[-1].id)
+                .order_by(EventoWebhook.id)
+                .with_for_update(skip_locked=True)
+                .all())
+
+    # Coalesce: vários eventos do mesmo pagamento geram uma única consulta ao MP
+    grupos = {}
+    for evento in eventos:
+        grupos.setdefault((evento.tipo, evento.recurso_id), []).append(evento)
+
+    pagamentos = {}
+    erros = {}
+    for (tipo, recurso_id) in grupos:
+        if tipo != 'payment':
+            continue
+        try:
+            pagamentos[recurso_id] = gateway_mp.consultar_pagamento(recurso_id)
+        except DisjuntorAberto:
+            break  # MP fora do ar — o resto do lote fica para a próxima rodada
+        except ErroGateway as e:
+            erros[recurso_id] = str(e)
+
+    ids_pedidos = {int(p['external_reference']) for p in pagamentos.values()
+                   if str(p.get('external_reference') or '').isdigit()}
+    # FOR UPDATE: o `reconciliar-pagamentos` pode estar mexendo nos mesmos pedidos
+    pedidos = ({p.id: p for p in Pedido.query.filter(Pedido.id.in_(ids_pedidos))
+                .order_by(Pedido.id).with_for_update().all()} if ids_pedidos else {})
+
+    agora = datetime.utcnow()
+    processados = 0
+    for (tipo, recurso_id), grupo in grupos.items():
+        if tipo == 'payment' and recurso_id not in pagamentos:
+            erro = erros.get(recurso_id)
+            if erro is None:
+                continue  # não chegou a ser consultado (disjuntor aberto)
+            for evento in grupo:
+                evento.tentativas += 1
+                evento.erro = erro
+                if evento.tentativas >= WEBHOOK_MAX_TENTATIVAS:
+                    evento.processado_em = agora  # desiste; fica registrado com o erro
+                    processados += 1
+            continue
+
+        if tipo == 'payment':
+            pagamento = pagamentos[recurso_id]
+            ref = str(pagamento.get('external_reference') or '')
+            pedido = pedidos.get(int(ref)) if ref.isdigit() else None
+            if pedido:
+                aplicar_status_pagamento(pedido, pagamento.get('status'), recurso_id)
+        for evento in grupo:
+            evento.processado_em = agora
+            evento.erro = None
+            processados += 1
+
+    db.session.commit()
+    return processados
+
+
+@app.cli.command('processar-webhooks')
+@click.option('--lote', default=100, show_default=True, help='Eventos por transação.')
+@click.option('--loop', is_flag=True, help='Fica rodando e esvazia a fila continuamente.')
+@click.option('--intervalo', default=5.0, show_default=True, help='Segundos de espera com a fila vazia.')
+def processar_webhooks_command(lote, loop, intervalo):
+    """Esvazia a caixa de entrada de webhooks do Mercado Pago."""
+    while True:
+        processados = processar_lote_webhooks(lote)
+        if processados:
+            click.echo(f'{processados} evento(s) processado(s).')
+        elif not loop:
+            break
+        else:
+            time.sleep(intervalo)
+
+
+# ── RECONCILIAÇÃO DE PAGAMENTOS ───────────────────────────────────────────────
+
+RECONCILIACAO_PAGINA_MP = 500   # resultados por página da busca de pagamentos
+RECONCILIACAO_MAX_PAGINAS = 20  # teto de páginas por busca; acima disso a janela é dividida
+RECONCILIACAO_JANELA_MINIMA = timedelta(minutes=1)  # menor janela que ainda vale dividir
+
+
+def formatar_data_mp(data):
+    return data.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def buscar_pagamentos_periodo(inicio, fim):
+    """Pagamentos criados entre `inicio` e `fim` (UTC): uma busca por lote, paginada só se preciso.
+
+    Devolve (pagamentos, completo). Se o total passa do teto de páginas, a janela é dividida ao
+    meio; `completo` é False só quando nem a menor janela coube e sobraram pagamentos de fora."""
+    pagamentos, offset = [], 0
+    for _ in range(RECONCILIACAO_MAX_PAGINAS):
+        resposta = gateway_mp.buscar_pagamentos({
+            'range': 'date_created', 'begin_date': formatar_data_mp(inicio), 'end_date': formatar_data_mp(fim),
+            'sort': 'date_created', 'criteria': 'asc', 'limit': RECONCILIACAO_PAGINA_MP, 'offset': offset,
+        })
+        resultados = resposta.get('results') or []
+        total = (resposta.get('paging') or {}).get('total', 0)
+        if (not offset and total > RECONCILIACAO_PAGINA_MP * RECONCILIACAO_MAX_PAGINAS
+                and fim - inicio > RECONCILIACAO_JANELA_MINIMA):
+            meio = inicio + (fim - inicio) / 2
+            antes, completo_antes = buscar_pagamentos_periodo(inicio, meio)
+            depois, completo_depois = buscar_pagamentos_periodo(meio, fim)
+            # As duas metades se tocam no `meio`: um pagamento desse segundo vem nas duas
+            unicos = {p.get('id'): p for p in antes + depois}
+            return list(unicos.values()), completo_antes and completo_depois
+        pagamentos.extend(resultados)
+        offset += len(resultados)
+        if not resultados or offset >= total:
+            return pagamentos, True
+    app.logger.warning('Busca de pagamentos truncada: %s de %s entre %s e %s',
+                       offset, total, formatar_data_mp(inicio), formatar_data_mp(fim))
+    return pagamentos, False
+
+
+def pagamento_decisivo(pagamentos):
+    """Entre vários pagamentos do mesmo pedido (ex.: cartão recusado e depois aprovado) vale o aprovado; senão, o mais recente."""
+    aprovados = [p for p in pagamentos if p.get('status') == 'approved']
+    return (aprovados or sorted(pagamentos, key=lambda p: p.get('date_last_updated') or p.get('date_created') or ''))[-1]
+
+
+def lotes_pedidos_pendentes(tamanho_lote, desde):
+    """Lotes de (id, preference_id, data_pedido) dos pedidos pendentes que já têm preferência no MP."""
+    ultimo_id = 0
+    while True:
+        lote = (db.session.query(Pedido.id, Pedido.preference_id, Pedido.data_pedido)
+                .filter(Pedido.status_pagamento == 'Pendente', Pedido.preference_id.isnot(None),
+                        Pedido.data_pedido >= desde, Pedido.id > ultimo_id)
+                .order_by(Pedido.id)
+                .limit(tamanho_lote)
+                .all())
+        if not lote:
+            return
+        yield lote
+        ultimo_id = lote[-1].id
+
+
+def aplicar_pagamentos_do_lote(lote, pagamentos):
+    """Casa os pagamentos com os pedidos do lote e grava tudo numa transação; devolve quantos mudaram."""
+    ids = {linha.id for linha in lote}
+    por_preferencia = {linha.preference_id: linha.id for linha in lote}
+    por_pedido = {}
+    for pagamento in pagamentos:
+        ref = str(pagamento.get('external_reference') or '')
+        pedido_id = int(ref) if ref.isdigit() and int(ref) in ids else por_preferencia.get(pagamento.get('preference_id'))
+        if pedido_id is not None:
+            por_pedido.setdefault(pedido_id, []).append(pagamento)
+    if not por_pedido:
+        return 0
+
+    # Relê com lock: o pedido pode ter sido atualizado pelo webhook enquanto o MP respondia
+    pedidos = (Pedido.query
+               .filter(Pedido.id.in_(por_pedido), Pedido.status_pagamento == 'Pendente')
+               .order_by(Pedido.id)
+               .with_for_update()
+               .all())
+    atualizados = 0
+    for pedido in pedidos:
+        pagamento = pagamento_decisivo(por_pedido[pedido.id])
+        aplicar_status_pagamento(pedido, pagamento.get('status'), pagamento.get('id'))
+        atualizados += pedido.status_pagamento != 'Pendente'
+    db.session.commit()
+    return atualizados
+
+
+def reconciliar_pagamentos(tamanho_lote=100, concorrencia=2, dias=7, janela=timedelta(hours=24)):
+    """Confere no MP os pedidos pendentes dos últimos `dias`, em lotes, com no máximo
+    `concorrencia` buscas em andamento; as gravações ficam nesta thread, uma transação por lote."""
+    agora = datetime.utcnow()
+    resumo = {'pedidos': 0, 'atualizados': 0, 'lotes_com_erro': 0, 'lotes_truncados': 0}
+
+    def aplicar(lote, futuro):
+        try:
+            pagamentos, completo = futuro.result()
+        except DisjuntorAberto:
+            raise
+        except ErroGateway:
+            app.logger.exception('Falha ao buscar pagamentos do lote %s-%s', lote[0].id, lote[-1].id)
+            resumo['lotes_com_erro'] += 1
+            return
+        # Aplica o que veio; os pedidos sem pagamento encontrado seguem pendentes para a próxima rodada
+        resumo['lotes_truncados'] += not completo
+        resumo['pedidos'] += len(lote)
+        resumo['atualizados'] += aplicar_pagamentos_do_lote(lote, pagamentos)
+
+    executor = ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix='reconciliacao')
+    em_andamento = []
+    try:
+        for lote in lotes_pedidos_pendentes(tamanho_lote, agora - timedelta(days=dias)):
+            # O pagamento nasce depois do pedido: a janela vai do pedido mais antigo até `janela` depois do mais novo
+            inicio = min(linha.data_pedido for linha in lote) - timedelta(minutes=5)
+            fim = min(max(linha.data_pedido for linha in lote) + janela, agora)
+            em_andamento.append((lote, executor.submit(buscar_pagamentos_periodo, inicio, fim)))
+            if len(em_andamento) >= concorrencia:
+                aplicar(*em_andamento.pop(0))
+        while em_andamento:
+            aplicar(*em_andamento.pop(0))
+    except DisjuntorAberto:
+        app.logger.warning('Reconciliação interrompida: Mercado Pago indisponível (disjuntor aberto)')
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return resumo
+
+
+@app.cli.command('reconciliar-pagamentos')
+@click.option('--lote', default=100, show_default=True, help='Pedidos por busca no MP (e por transação).')
+@click.option('--concorrencia', default=2, show_default=True, help='Buscas simultâneas no MP.')
+@click.option('--dias', default=7, show_default=True, help='Só pedidos feitos nos últimos N dias.')
+@click.option('--janela-horas', default=24, show_default=True,
+              help='Até quantas horas depois do pedido um pagamento ainda é procurado.')
+@click.option('--loop', is_flag=True, help='Fica rodando, reconciliando a cada --intervalo segundos.')
+@click.option('--intervalo', default=600.0, show_default=True, help='Segundos entre rodadas com --loop.')
+def reconciliar_pagamentos_command(lote, concorrencia, dias, janela_horas, loop, intervalo):
+    """Atualiza pedidos que ficaram 'Pendente' por falta de webhook ou de retorno do navegador."""
+    if not gateway_mp.configurado:
+        raise click.ClickException('MERCADOPAGO_ACCESS_TOKEN não configurado.')
+    while True:
+        resumo = reconciliar_pagamentos(lote, concorrencia, dias, timedelta(hours=janela_horas))
+        click.echo(f"{resumo['pedidos']} pedido(s) conferido(s), {resumo['atualizados']} atualizado(s)"
+                   + (f", {resumo['lotes_com_erro']} lote(s) com erro" if resumo['lotes_com_erro'] else '')
+                   + (f", {resumo['lotes_truncados']} lote(s) com busca incompleta (diminua --lote)"
+                      if resumo['lotes_truncados'] else '') + '.')
+        if not loop:
+            break
+        time.sleep(intervalo)
+
+
+# ── PEDIDOS ABANDONADOS ───────────────────────────────────────────────────────
+
+def expirar_pedidos_abandonados(tamanho_lote=200):
+    """Apaga, em lotes, os pedidos que foram ao MP e não tiveram pagamento dentro de
+    PEDIDOS_EXPIRAM_HORAS (o link da preferência expira junto). Devolve quantos saíram."""
+    limite = datetime.utcnow() - timedelta(hours=app.config['PEDIDOS_EXPIRAM_HORAS'])
+    total = 0
+    while True:
+        # Pedidos sem chave nem preferência são de antes do MP (combinados por contato): ficam
+        pedidos = (Pedido.query
+                   .filter(Pedido.status == 'Pendente', Pedido.status_pagamento == 'Pendente',
+                           Pedido.payment_id.is_(None), Pedido.data_pedido < limite,
+                           or_(Pedido.preference_id.isnot(None), Pedido.chave_idempotencia.isnot(None)))
+                   .options(selectinload(Pedido.itens))
+                   .order_by(Pedido.id)
+                   .limit(tamanho_lote)
+                   .with_for_update(skip_locked=True)
+                   .all())
+        if not pedidos:
+            return total
+        for pedido in pedidos:
+            db.session.delete(pedido)  # pelo ORM: o resumo de vendas acompanha
+        db.session.commit()
+        total += len(pedidos)
+
+
+@app.cli.command('expirar-pedidos')
+@click.option('--lote', default=200, show_default=True, help='Pedidos apagados por transação.')
+def expirar_pedidos_command(lote):
+    """Remove os pedidos abandonados no checkout do Mercado Pago."""
+    if not gateway_mp.configurado:
+        raise click.ClickException('MERCADOPAGO_ACCESS_TOKEN não configurado — os pedidos pendentes '
+                                   'são combinados por contato e não expiram.')
+    click.echo(f'{expirar_pedidos_abandonados(lote)} pedido(s) expirado(s).')
+
+
+# ── RESUMO DE VENDAS ──────────────────────────────────────────────────────────
+
+VENDAS_PERIODOS = (7, 30, 90, 365)
+VENDAS_TOP_PRODUTOS = 10
+
+
+def linhas_de_venda(pedido):
+    """{produto_id: (unidades, receita)} do pedido; pedidos antigos sem itens usam `produto`."""
+    if not pedido.itens:
+        return {pedido.produto_id: (pedido.quantidade, pedido.total)} if pedido.produto_id else {}
+    linhas = {}
+    for item in pedido.itens:
+        # Itens novos só têm `produto` (o produto_id é preenchido no flush)
+        produto_id = item.produto_id if item.produto_id is not None else (item.produto.id if item.produto else None)
+        if produto_id is None:
+            continue
+        unidades, receita = linhas.get(produto_id, (0, 0.0))
+        linhas[produto_id] = (unidades + item.quantidade, receita + item.subtotal)
+    return linhas
+
+
+def somar_no_resumo(conexao, tabela, chave, pedidos, unidades, receita):
+    """Soma os deltas na linha `chave` do resumo, criando-a se ainda não existir."""
+    valores = dict(chave, pedidos=pedidos, unidades=unidades, receita=receita)
+    dialeto = conexao.dialect.name
+    if dialeto in ('sqlite', 'postgresql'):
+        stmt = (insert_sqlite if dialeto == 'sqlite' else insert_postgresql)(tabela).values(**valores)
+        conexao.execute(stmt.on_conflict_do_update(
+            index_elements=list(chave),
+            set_={c: tabela.c[c] + stmt.excluded[c] for c in ('pedidos', 'unidades', 'receita')},
+        ))
+        return
+    resultado = conexao.execute(
+        update(tabela)
+        .where(*[tabela.c[k] == v for k, v in chave.items()])
+        .values(pedidos=tabela.c.pedidos + pedidos, unidades=tabela.c.unidades + unidades,
+                receita=tabela.c.receita + receita))
+    if resultado.rowcount == 0:
+        conexao.execute(insert(tabela).values(**valores))
+
+
+@event.listens_for(db.session, 'before_flush')
+def atualizar_resumo_vendas(sessao, contexto, instancias):
+    """Mantém VendaDiaria/VendaDiariaProduto na mesma transação em que um Pedido nasce,
+    muda de status_pagamento ou é apagado — vale para checkout, webhooks, retornos do MP e admin."""
+    por_dia, por_produto = {}, {}
+
+    def somar(pedido, status, sinal):
+        dia = pedido.data_pedido.date()
+        status = status or 'Pendente'
+        total = por_dia.setdefault((dia, status), [0, 0, 0.0])
+        total[0] += sinal; total[1] += sinal * pedido.quantidade; total[2] += sinal * pedido.total
+        for produto_id, (unidades, receita) in linhas_de_venda(pedido).items():
+            linha = por_produto.setdefault((dia, produto_id, status), [0, 0, 0.0])
+            linha[0] += sinal; linha[1] += sinal * unidades; linha[2] += sinal * receita
+
+    for pedido in sessao.new:
+        if isinstance(pedido, Pedido):
+            # Fixa a data já aqui para o pedido e o resumo caírem no mesmo dia
+            pedido.data_pedido = pedido.data_pedido or datetime.utcnow()
+            somar(pedido, pedido.status_pagamento, 1)
+    for pedido in sessao.dirty:
+        if isinstance(pedido, Pedido) and pedido not in sessao.deleted:
+            historico = inspect(pedido).attrs.status_pagamento.history
+            if historico.deleted and historico.added and historico.deleted[0] != historico.added[0]:
+                somar(pedido, historico.deleted[0], -1)
+                somar(pedido, historico.added[0], 1)
+    for pedido in sessao.deleted:
+        if isinstance(pedido, Pedido):
+            historico = inspect(pedido).attrs.status_pagamento.history
+            somar(pedido, historico.deleted[0] if historico.deleted else pedido.status_pagamento, -1)
+
+    if not por_dia:
+        return
+    conexao = sessao.connection()
+    # Ordem fixa das chaves: duas transações nunca travam as mesmas linhas em ordem inversa
+    for (dia, status), deltas in sorted(por_dia.items()):
+        somar_no_resumo(conexao, VendaDiaria.__table__, {'dia': dia, 'status_pagamento': status}, *deltas)
+    for (dia, produto_id, status), deltas in sorted(por_produto.items()):
+        somar_no_resumo(conexao, VendaDiariaProduto.__table__,
+                        {'dia': dia, 'produto_id': produto_id, 'status_pagamento': status}, *deltas)
+
+
+def recalcular_resumo_vendas(desde=None):
+    """Reconstrói os resumos a partir dos pedidos (todos, ou de `desde` em diante) numa só transação."""
+    dia = func.date(Pedido.data_pedido)
+    status = func.coalesce(Pedido.status_pagamento, 'Pendente')
+    filtro = [Pedido.data_pedido >= desde] if desde else []
+
+    for modelo in (VendaDiaria, VendaDiariaProduto):
+        db.session.execute(delete(modelo).where(modelo.dia >= desde.date()) if desde else delete(modelo))
+
+    db.session.execute(insert(VendaDiaria).from_select(
+        ['dia', 'status_pagamento', 'pedidos', 'unidades', 'receita'],
+        select(dia, status, func.count(Pedido.id), func.sum(Pedido.quantidade), func.sum(Pedido.total))
+        .where(*filtro)
+        .group_by(dia, status)))
+
+    itens = (select(dia.label('dia'), ItemPedido.produto_id.label('produto_id'), status.label('status'),
+                    Pedido.id.label('pedido_id'), ItemPedido.quantidade.label('unidades'),
+                    (ItemPedido.quantidade * ItemPedido.preco_unitario).label('receita'))
+             .join_from(Pedido, ItemPedido)
+             .where(ItemPedido.produto_id.isnot(None), *filtro))
+    antigos = (select(dia, Pedido.produto_id, status, Pedido.id, Pedido.quantidade, Pedido.total)
+               .where(~Pedido.itens.any(), Pedido.produto_id.isnot(None), *filtro))
+    linhas = union_all(itens, antigos).subquery()
+    db.session.execute(insert(VendaDiariaProduto).from_select(
+        ['dia', 'produto_id', 'status_pagamento', 'pedidos', 'unidades', 'receita'],
+        select(linhas.c.dia, linhas.c.produto_id, linhas.c.status, func.count(func.distinct(linhas.c.pedido_id)),
+               func.sum(linhas.c.unidades), func.sum(linhas.c.receita))
+        .group_by(linhas.c.dia, linhas.c.produto_id, linhas.c.status)))
+    db.session.commit()
+
+
+@app.cli.command('recalcular-vendas')
+@click.option('--desde', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Só reconstrói a partir deste dia (AAAA-MM-DD); sem ele, refaz tudo.')
+def recalcular_vendas_command(desde):
+    """Reconstrói o resumo de vendas do painel a partir dos pedidos."""
+    recalcular_resumo_vendas(desde)
+    dias = db.session.query(func.count(func.distinct(VendaDiaria.dia))).scalar()
+    click.echo(f'Resumo de vendas reconstruído ({dias} dia(s) com pedidos).')
+
+
+@app.route('/admin/vendas')
+@login_required
+def admin_vendas():
+    """Painel de vendas: lê só os resumos, então o custo depende do período, não do histórico."""
+    dias = request.args.get('dias', 30, type=int)
+    if dias not in VENDAS_PERIODOS:
+        dias = 30
+    hoje = datetime.utcnow().date()
+    inicio = hoje - timedelta(days=dias - 1)
+
+    por_status = {}
+    serie = {inicio + timedelta(days=n): 0.0 for n in range(dias)}
+    for linha in VendaDiaria.query.filter(VendaDiaria.dia >= inicio).all():
+        total = por_status.setdefault(linha.status_pagamento, {'pedidos': 0, 'unidades': 0, 'receita': 0.0})
+        total['pedidos'] += linha.pedidos; total['unidades'] += linha.unidades; total['receita'] += linha.receita
+        if linha.status_pagamento == 'Aprovado' and linha.dia in serie:
+            serie[linha.dia] += linha.receita
+
+    aprovados = [VendaDiariaProduto.dia >= inicio, VendaDiariaProduto.status_pagamento == 'Aprovado']
+    receita = func.sum(VendaDiariaProduto.receita)
+    top_produtos = (db.session.query(VendaDiariaProduto.produto_id, Produto.nome, Produto.categoria,
+                                     func.sum(VendaDiariaProduto.unidades), receita)
+                    .outerjoin(Produto, Produto.id == VendaDiariaProduto.produto_id)
+                    .filter(*aprovados)
+                    .group_by(VendaDiariaProduto.produto_id, Produto.nome, Produto.categoria)
+                    .order_by(receita.desc())
+                    .limit(VENDAS_TOP_PRODUTOS)
+                    .all())
+    categorias = (db.session.query(Produto.categoria, func.sum(VendaDiariaProduto.unidades), receita)
+                  .outerjoin(Produto, Produto.id == VendaDiariaProduto.produto_id)
+                  .filter(*aprovados)
+                  .group_by(Produto.categoria)
+                  .order_by(receita.desc())
+                  .all())
+
+    return render_template('admin_vendas.html', dias=dias, periodos=VENDAS_PERIODOS, por_status=por_status,
+                           serie=list(serie.items()), maximo_serie=max(serie.values(), default=0),
+                           top_produtos=top_produtos, categorias=categorias)
+
+
+# ── DIAGNÓSTICO ───────────────────────────────────────────────────────────────
+
+def consultas_quentes():
+    """As consultas das rotas mais acessadas, com parâmetros de exemplo.
+
+    Cada item é (nome, consulta, varredura_aceitavel): listagens sem filtro que
+    leem a tabela inteira (ou param no LIMIT) podem varrer; as demais não.
+    """
+    desde = datetime.utcnow() - timedelta(days=30)
+    return [
+        ('index: destaques', Produto.query.limit(6), True),
+        ('produtos: mais recentes', consulta_vitrine(), True),
+        ('produtos: mais recentes (cursor)', consulta_vitrine(cursor=(None, 100)), False),
+        ('produtos: menor preço (cursor)', consulta_vitrine(ordem='menor_preco', cursor=(50.0, 10)), False),
+        ('produtos: por categoria', consulta_vitrine(categoria='Amigurumi'), False),
+        ('produtos: categoria, maior preço (cursor)',
+         consulta_vitrine(categoria='Amigurumi', ordem='maior_preco', cursor=(50.0, 10)), False),
+        ('produtos: categorias', db.session.query(Produto.categoria).distinct(), False),
+        ('api_produtos: página', Produto.query.filter_by(disponivel=True).order_by(Produto.id).limit(50), False),
+        ('api_produto: por id', Produto.query.filter_by(id=1, disponivel=True), False),
+        ('admin_pedidos: primeira página',
+         Pedido.query.order_by(Pedido.data_pedido.desc(), Pedido.id.desc()).limit(51), False),
+        ('admin_pedidos: cursor',
+         Pedido.query.filter(or_(Pedido.data_pedido < desde,
+                                 and_(Pedido.data_pedido == desde, Pedido.id < 1000)))
+         .order_by(Pedido.data_pedido.desc(), Pedido.id.desc()).limit(51), False),
+        ('admin_pedidos: por status',
+         filtrar_pedidos(Pedido.query, {'status': 'Pendente'})
+         .order_by(Pedido.data_pedido.desc(), Pedido.id.desc()).limit(51), False),
+        ('admin_pedidos: por pagamento e período',
+         filtrar_pedidos(Pedido.query, {'status_pagamento': 'Aprovado', 'de': f'{desde:%Y-%m-%d}'})
+         .order_by(Pedido.data_pedido.desc(), Pedido.id.desc()).limit(51), False),
+        ('admin_pedidos: contagem por status',
+         db.session.query(Pedido.status, func.count(Pedido.id)).group_by(Pedido.status), False),
+        ('itens do pedido (selectinload)', ItemPedido.query.filter(ItemPedido.pedido_id.in_([1, 2, 3])), False),
+        ('pedido por preference_id', Pedido.query.filter_by(preference_id='pref-exemplo'), False),
+        ('pedido por payment_id', Pedido.query.filter_by(payment_id='123'), False),
+        ('webhook: repetições do lote',
+         EventoWebhook.query.filter(EventoWebhook.processado_em.is_(None),
+                                    tuple_(EventoWebhook.tipo, EventoWebhook.recurso_id).in_([('payment', '123')]),
+                                    EventoWebhook.id > 100), False),
+        ('webhook: pendentes',
+         EventoWebhook.query.filter(EventoWebhook.processado_em.is_(None)).order_by(EventoWebhook.id).limit(100),
+         False),
+    ]
+
+
+def plano_de_execucao(consulta):
+    """Roda EXPLAIN (SQLite: EXPLAIN QUERY PLAN) e devolve (linhas do plano, houve varredura completa)."""
+    dialeto = db.engine.dialect
+    sql = str(consulta.statement.compile(dialect=dialeto, compile_kwargs={'literal_binds': True}))
+
+    if dialeto.name == 'sqlite':
+        linhas = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).fetchall()
+        plano = [linha[-1] for linha in linhas]
+        # SCAN CONSTANT ROW é a lista literal de um IN (...), não uma tabela
+        varredura = any(p.startswith('SCAN ') and ' USING ' not in p and p != 'SCAN CONSTANT ROW' for p in plano)
+    else:
+        linhas = db.session.connection().exec_driver_sql('EXPLAIN ' + sql).fetchall()
+        plano = [linha[0] for linha in linhas]
+        varredura = any('Seq Scan' in p for p in plano)
+    return plano, varredura
+
+
+@app.cli.command('explicar-consultas')
+@click.option('--estrito', is_flag=True, help='Sai com erro se alguma consulta fizer varredura completa.')
+def explicar_consultas_command(estrito):
+    """Mostra o plano de execução de cada consulta quente e aponta varreduras completas."""
+    problemas = []
+    click.echo(f'Banco: {db.engine.dialect.name}\n')
+    for nome, consulta, varredura_aceitavel in consultas_quentes():
+        plano, varredura = plano_de_execucao(consulta)
+        marcador = '✓'
+        if varredura:
+            marcador = '~' if varredura_aceitavel else '✗'
+            if not varredura_aceitavel:
+                problemas.append(nome)
+        click.echo(f'{marcador} {nome}')
+        for linha in plano:
+            click.echo(f'    {linha}')
+
+    if db.engine.dialect.name != 'sqlite':
+        click.echo('\nObs.: no PostgreSQL, tabelas pequenas podem usar Seq Scan mesmo com índice; '
+                   'rode com dados realistas (e ANALYZE) antes de concluir algo.')
+    if problemas:
+        click.echo(f'\n{len(problemas)} consulta(s) com varredura completa: {", ".join(problemas)}')
+        if estrito:
+            raise SystemExit(1)
+    else:
+        click.echo('\nNenhuma consulta com varredura completa inesperada.')
 
 
 if __name__ == '__main__':
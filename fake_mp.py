@@ -0,0 +1,176 @@
+"""Servidor fake da API do Mercado Pago, para testes e benchmarks locais.
+
+Implementa só o que a loja usa (preferências, pagamentos e OAuth), com latência
+e taxa de erro configuráveis — serve para ver como o app se comporta quando o MP
+está lento ou fora do ar, sem tocar na API real.
+
+Uso:
+    python fake_mp.py --porta 8089 --latencia 0.3 --taxa-erro 0.1
+    MP_API_URL=http://127.0.0.1:8089 MERCADOPAGO_ACCESS_TOKEN=TEST-fake python app.py
+
+Pagamentos podem ser cadastrados com POST /v1/payments
+({"external_reference": "42", "status": "approved"}) e consultados pelo webhook ou
+pela busca (/v1/payments/search, com range=date_created, limit e offset).
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def agora_iso():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def ler_data(texto):
+    """Datas ISO 8601 como a API aceita (`Z` ou offset); devolve datetime com fuso, ou None."""
+    return datetime.fromisoformat(texto.replace('Z', '+00:00')) if texto else None
+
+
+class EstadoFake:
+    def __init__(self, latencia=0.0, jitter=0.0, taxa_erro=0.0):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.taxa_erro = taxa_erro
+        self.preferencias = {}
+        self.pagamentos = {}
+        self.chamadas = 0
+        self._ids = itertools.count(1000)
+        self._lock = threading.Lock()
+
+    def novo_id(self):
+        with self._lock:
+            self.chamadas += 1
+            return next(self._ids)
+
+
+class HandlerFake(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como a API real
+    estado = None
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _corpo(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(tamanho) or b'{}') if tamanho else {}
+
+    def _simular_rede(self):
+        """Aplica latência/erros configurados; devolve True se já respondeu com erro."""
+        estado = self.estado
+        atraso = estado.latencia + random.uniform(0, estado.jitter)
+        if atraso:
+            time.sleep(atraso)
+        if estado.taxa_erro and random.random() < estado.taxa_erro:
+            self._responder(503, {'message': 'fake: serviço indisponível'})
+            return True
+        return False
+
+    def do_POST(self):
+        corpo = self._corpo()
+        if self._simular_rede():
+            return
+        rota = urlparse(self.path).path
+        estado = self.estado
+
+        if rota == '/checkout/preferences':
+            pref_id = f'fake-pref-{estado.novo_id()}'
+            preferencia = dict(corpo, id=pref_id,
+                               init_point=f'http://fake-mp.local/checkout?pref_id={pref_id}',
+                               sandbox_init_point=f'http://fake-mp.local/sandbox?pref_id={pref_id}')
+            estado.preferencias[pref_id] = preferencia
+            return self._responder(201, preferencia)
+
+        if rota == '/v1/payments':
+            pagamento_id = estado.novo_id()
+            pagamento = {'id': pagamento_id, 'status': corpo.get('status', 'approved'),
+                         'external_reference': corpo.get('external_reference'),
+                         'preference_id': corpo.get('preference_id'),
+                         'date_created': corpo.get('date_created') or agora_iso()}
+            estado.pagamentos[pagamento_id] = pagamento
+            return self._responder(201, pagamento)
+
+        if rota == '/oauth/token':
+            estado.novo_id()
+            return self._responder(200, {'access_token': 'TEST-fake-seller-token',
+                                         'refresh_token': 'TEST-fake-refresh', 'user_id': 1})
+
+        self._responder(404, {'message': f'fake: rota desconhecida {rota}'})
+
+    def do_GET(self):
+        if self._simular_rede():
+            return
+        url = urlparse(self.path)
+        estado = self.estado
+        estado.novo_id()
+
+        if url.path == '/v1/payments/search':
+            filtros = {k: v[0] for k, v in parse_qs(url.query).items()}
+            resultados = [p for p in estado.pagamentos.values()
+                          if all(str(p.get(k)) == v for k, v in filtros.items()
+                                 if k in ('external_reference', 'status', 'preference_id'))]
+            if filtros.get('range') == 'date_created':
+                inicio = ler_data(filtros.get('begin_date'))
+                fim = ler_data(filtros.get('end_date'))
+                resultados = [p for p in resultados
+                              if (not inicio or ler_data(p['date_created']) >= inicio)
+                              and (not fim or ler_data(p['date_created']) <= fim)]
+            resultados.sort(key=lambda p: ler_data(p['date_created']),
+                            reverse=filtros.get('criteria') == 'desc')
+            limite = int(filtros.get('limit', 30))
+            offset = int(filtros.get('offset', 0))
+            return self._responder(200, {'results': resultados[offset:offset + limite],
+                                         'paging': {'total': len(resultados), 'limit': limite, 'offset': offset}})
+
+        achado = re.fullmatch(r'/v1/payments/(\d+)', url.path)
+        if achado:
+            pagamento = estado.pagamentos.get(int(achado.group(1)))
+            if pagamento is None:
+                return self._responder(404, {'message': 'Payment not found'})
+            return self._responder(200, pagamento)
+
+        achado = re.fullmatch(r'/checkout/preferences/([\w-]+)', url.path)
+        if achado and achado.group(1) in estado.preferencias:
+            return self._responder(200, estado.preferencias[achado.group(1)])
+
+        self._responder(404, {'message': f'fake: rota desconhecida {url.path}'})
+
+
+def iniciar_servidor_fake(porta=0, latencia=0.0, jitter=0.0, taxa_erro=0.0):
+    """Sobe o servidor numa thread e devolve (servidor, estado). `porta=0` escolhe uma livre."""
+    estado = EstadoFake(latencia, jitter, taxa_erro)
+    handler = type('HandlerFakeConfigurado', (HandlerFake,), {'estado': estado})
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, estado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='API fake do Mercado Pago')
+    parser.add_argument('--porta', type=int, default=8089)
+    parser.add_argument('--latencia', type=float, default=0.0, help='atraso fixo por chamada, em segundos')
+    parser.add_argument('--jitter', type=float, default=0.0, help='atraso aleatório extra, em segundos')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='fração de chamadas que devolvem 503')
+    args = parser.parse_args()
+
+    servidor, _ = iniciar_servidor_fake(args.porta, args.latencia, args.jitter, args.taxa_erro)
+    print(f'Fake Mercado Pago em http://127.0.0.1:{servidor.server_port} — Ctrl+C para sair')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,98 @@
+"""schema inicial
+
+Bancos criados antes das migrações (via db.create_all) já têm parte destas
+tabelas, então cada tabela só é criada se ainda não existir.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-16 22:27:38.198607
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+def tabela_existe(nome):
+    return sa.inspect(op.get_bind()).has_table(nome)
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not tabela_existe('admin_user'):
+        op.create_table('admin_user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=80), nullable=False),
+        sa.Column('password_hash', sa.String(length=256), nullable=False),
+        sa.Column('criado_em', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username')
+        )
+    if not tabela_existe('evento_webhook'):
+        op.create_table('evento_webhook',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tipo', sa.String(length=50), nullable=False),
+        sa.Column('recurso_id', sa.String(length=100), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('recebido_em', sa.DateTime(), nullable=True),
+        sa.Column('processado_em', sa.DateTime(), nullable=True),
+        sa.Column('tentativas', sa.Integer(), nullable=False),
+        sa.Column('erro', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not tabela_existe('produto'):
+        op.create_table('produto',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nome', sa.String(length=100), nullable=False),
+        sa.Column('descricao', sa.Text(), nullable=False),
+        sa.Column('preco', sa.Float(), nullable=False),
+        sa.Column('imagem_url', sa.String(length=200), nullable=True),
+        sa.Column('prazo_dias', sa.Integer(), nullable=True),
+        sa.Column('categoria', sa.String(length=50), nullable=True),
+        sa.Column('data_criacao', sa.DateTime(), nullable=True),
+        sa.Column('disponivel', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not tabela_existe('pedido'):
+        op.create_table('pedido',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nome_cliente', sa.String(length=100), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('telefone', sa.String(length=20), nullable=True),
+        sa.Column('endereco', sa.Text(), nullable=False),
+        sa.Column('produto_id', sa.Integer(), nullable=True),
+        sa.Column('quantidade', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('status_pagamento', sa.String(length=20), nullable=True),
+        sa.Column('payment_id', sa.String(length=100), nullable=True),
+        sa.Column('preference_id', sa.String(length=100), nullable=True),
+        sa.Column('data_pedido', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['produto_id'], ['produto.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not tabela_existe('item_pedido'):
+        op.create_table('item_pedido',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('pedido_id', sa.Integer(), nullable=False),
+        sa.Column('produto_id', sa.Integer(), nullable=True),
+        sa.Column('nome_produto', sa.String(length=100), nullable=False),
+        sa.Column('quantidade', sa.Integer(), nullable=False),
+        sa.Column('preco_unitario', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['pedido_id'], ['pedido.id'], ),
+        sa.ForeignKeyConstraint(['produto_id'], ['produto.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('item_pedido')
+    op.drop_table('pedido')
+    op.drop_table('produto')
+    op.drop_table('evento_webhook')
+    op.drop_table('admin_user')
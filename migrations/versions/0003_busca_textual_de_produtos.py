@@ -0,0 +1,74 @@
+"""busca textual de produtos
+
+SQLite: tabela FTS5 `produto_fts` (external content) mantida por triggers.
+PostgreSQL: coluna gerada `produto.busca` (tsvector) com índice GIN.
+Nos dois casos o índice acompanha sozinho qualquer INSERT/UPDATE/DELETE em
+`produto` — inclusive a importação em massa.
+
+Atenção (SQLite): um batch_alter_table em `produto` recria a tabela e apaga os
+triggers; uma migração assim precisa recriá-los e rodar o 'rebuild'.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 22:29:31.640161
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER produto_fts_ai AFTER INSERT ON produto BEGIN
+        INSERT INTO produto_fts(rowid, nome, descricao, categoria)
+        VALUES (new.id, new.nome, new.descricao, new.categoria);
+    END""",
+    """CREATE TRIGGER produto_fts_ad AFTER DELETE ON produto BEGIN
+        INSERT INTO produto_fts(produto_fts, rowid, nome, descricao, categoria)
+        VALUES ('delete', old.id, old.nome, old.descricao, old.categoria);
+    END""",
+    """CREATE TRIGGER produto_fts_au AFTER UPDATE OF nome, descricao, categoria ON produto BEGIN
+        INSERT INTO produto_fts(produto_fts, rowid, nome, descricao, categoria)
+        VALUES ('delete', old.id, old.nome, old.descricao, old.categoria);
+        INSERT INTO produto_fts(rowid, nome, descricao, categoria)
+        VALUES (new.id, new.nome, new.descricao, new.categoria);
+    END""",
+]
+
+
+def upgrade():
+    dialeto = op.get_bind().dialect.name
+    if dialeto == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE produto_fts USING fts5("
+            "nome, descricao, categoria, content='produto', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        for trigger in SQLITE_TRIGGERS:
+            op.execute(trigger)
+        op.execute("INSERT INTO produto_fts(produto_fts) VALUES ('rebuild')")
+    elif dialeto == 'postgresql':
+        op.execute(
+            "ALTER TABLE produto ADD COLUMN busca tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('portuguese', coalesce(nome, '')), 'A') || "
+            "setweight(to_tsvector('portuguese', coalesce(categoria, '')), 'B') || "
+            "setweight(to_tsvector('portuguese', coalesce(descricao, '')), 'C')) STORED"
+        )
+        op.create_index('ix_produto_busca', 'produto', ['busca'], postgresql_using='gin')
+
+
+def downgrade():
+    dialeto = op.get_bind().dialect.name
+    if dialeto == 'sqlite':
+        for trigger in ('produto_fts_ai', 'produto_fts_ad', 'produto_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS produto_fts')
+    elif dialeto == 'postgresql':
+        op.drop_index('ix_produto_busca', table_name='produto')
+        op.drop_column('produto', 'busca')
@@ -0,0 +1,30 @@
+"""imagens de produtos
+
+Foto enviada pelo admin: hash do original e larguras das variantes já geradas.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16 22:34:35.119219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ADD/DROP COLUMN direto (sem batch_alter_table): no SQLite o batch recriaria a
+    # tabela `produto` e levaria junto os triggers da busca textual (0003).
+    op.add_column('produto', sa.Column('imagem_hash', sa.String(length=16), nullable=True))
+    op.add_column('produto', sa.Column('imagem_larguras', sa.String(length=50), nullable=True))
+
+
+def downgrade():
+    op.drop_column('produto', 'imagem_larguras')
+    op.drop_column('produto', 'imagem_hash')
@@ -0,0 +1,77 @@
+"""resumo de vendas
+
+Tabelas do painel /admin/vendas, mantidas pelo app a cada flush de Pedido.
+A migração já preenche as duas com o histórico existente (mesmo cálculo do
+comando `flask recalcular-vendas`).
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-16 22:47:46.852258
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+PREENCHER_VENDA_DIARIA = """
+    INSERT INTO venda_diaria (dia, status_pagamento, pedidos, unidades, receita)
+    SELECT date(data_pedido), coalesce(status_pagamento, 'Pendente'), count(id), sum(quantidade), sum(total)
+    FROM pedido
+    GROUP BY date(data_pedido), coalesce(status_pagamento, 'Pendente')
+"""
+
+PREENCHER_VENDA_DIARIA_PRODUTO = """
+    INSERT INTO venda_diaria_produto (dia, produto_id, status_pagamento, pedidos, unidades, receita)
+    SELECT dia, produto_id, status, count(DISTINCT pedido_id), sum(unidades), sum(receita)
+    FROM (
+        SELECT date(p.data_pedido) AS dia, i.produto_id, coalesce(p.status_pagamento, 'Pendente') AS status,
+               p.id AS pedido_id, i.quantidade AS unidades, i.quantidade * i.preco_unitario AS receita
+        FROM pedido p JOIN item_pedido i ON i.pedido_id = p.id
+        WHERE i.produto_id IS NOT NULL
+        UNION ALL
+        SELECT date(p.data_pedido), p.produto_id, coalesce(p.status_pagamento, 'Pendente'),
+               p.id, p.quantidade, p.total
+        FROM pedido p
+        WHERE p.produto_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM item_pedido i WHERE i.pedido_id = p.id)
+    ) AS linhas
+    GROUP BY dia, produto_id, status
+"""
+
+
+def upgrade():
+    op.create_table('venda_diaria',
+    sa.Column('dia', sa.Date(), nullable=False),
+    sa.Column('status_pagamento', sa.String(length=20), nullable=False),
+    sa.Column('pedidos', sa.Integer(), nullable=False),
+    sa.Column('unidades', sa.Integer(), nullable=False),
+    sa.Column('receita', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('dia', 'status_pagamento')
+    )
+    op.create_table('venda_diaria_produto',
+    sa.Column('dia', sa.Date(), nullable=False),
+    sa.Column('produto_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('status_pagamento', sa.String(length=20), nullable=False),
+    sa.Column('pedidos', sa.Integer(), nullable=False),
+    sa.Column('unidades', sa.Integer(), nullable=False),
+    sa.Column('receita', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('dia', 'produto_id', 'status_pagamento')
+    )
+    op.create_index('ix_venda_diaria_produto_status_dia', 'venda_diaria_produto', ['status_pagamento', 'dia'],
+                    unique=False)
+
+    op.execute(PREENCHER_VENDA_DIARIA)
+    op.execute(PREENCHER_VENDA_DIARIA_PRODUTO)
+
+
+def downgrade():
+    op.drop_index('ix_venda_diaria_produto_status_dia', table_name='venda_diaria_produto')
+    op.drop_table('venda_diaria_produto')
+    op.drop_table('venda_diaria')
@@ -0,0 +1,39 @@
+"""checkout idempotente
+
+Chave de idempotência do formulário + hash do pedido, init_point reaproveitável
+e a reserva que impede duas criações de preferência simultâneas.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-16 22:56:43.852604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pedido', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('init_point', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('chave_idempotencia', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('hash_checkout', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('preferencia_em_criacao', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_pedido_chave_idempotencia', ['chave_idempotencia'], unique=True)
+
+
+
+def downgrade():
+    with op.batch_alter_table('pedido', schema=None) as batch_op:
+        batch_op.drop_index('ix_pedido_chave_idempotencia')
+        batch_op.drop_column('preferencia_em_criacao')
+        batch_op.drop_column('hash_checkout')
+        batch_op.drop_column('chave_idempotencia')
+        batch_op.drop_column('init_point')
+
@@ -0,0 +1,34 @@
+"""vitrine paginada
+
+Índices do keyset da vitrine: (categoria, id) para "mais recentes" e (preco, id),
+com e sem categoria, para a ordenação por preço.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-16 23:00:12.508071
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Índices direto (sem batch_alter_table) para não recriar `produto` e perder os triggers da busca (0003)
+    op.drop_index('ix_produto_categoria', table_name='produto')
+    op.create_index('ix_produto_categoria_id', 'produto', ['categoria', 'id'], unique=False)
+    op.create_index('ix_produto_categoria_preco_id', 'produto', ['categoria', 'preco', 'id'], unique=False)
+    op.create_index('ix_produto_preco_id', 'produto', ['preco', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_produto_preco_id', table_name='produto')
+    op.drop_index('ix_produto_categoria_preco_id', table_name='produto')
+    op.drop_index('ix_produto_categoria_id', table_name='produto')
+    op.create_index('ix_produto_categoria', 'produto', ['categoria'], unique=False)
@@ -0,0 +1,44 @@
+"""itens sobrevivem ao produto
+
+ItemPedido.produto_id passa a ON DELETE SET NULL: o item guarda nome e preço, então
+um produto que já foi vendido pode ser apagado sem quebrar a FK.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-16 23:11:50.047265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+# No SQLite a FK original não tem nome: a convenção dá um para o batch conseguir trocá-la.
+# No PostgreSQL ela tem o nome padrão <tabela>_<coluna>_fkey.
+CONVENCAO = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def trocar_fk_produto(ondelete):
+    if op.get_bind().dialect.name == 'sqlite':
+        nome = 'fk_item_pedido_produto_id_produto'
+        with op.batch_alter_table('item_pedido', naming_convention=CONVENCAO) as batch_op:
+            batch_op.drop_constraint(nome, type_='foreignkey')
+            batch_op.create_foreign_key(nome, 'produto', ['produto_id'], ['id'], ondelete=ondelete)
+    else:
+        nome = 'item_pedido_produto_id_fkey'
+        op.drop_constraint(nome, 'item_pedido', type_='foreignkey')
+        op.create_foreign_key(nome, 'item_pedido', 'produto', ['produto_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    trocar_fk_produto('SET NULL')
+
+
+def downgrade():
+    trocar_fk_produto(None)
@@ -0,0 +1,15 @@
+function verificarSenha() {
+    const nova = document.getElementById('nova_senha').value;
+    const confirmar = document.getElementById('confirmar_senha').value;
+    const feedback = document.getElementById('senha-feedback');
+
+    if (!confirmar) { feedback.textContent = ''; return; }
+
+    if (nova === confirmar) {
+        feedback.textContent = '✅ As senhas coincidem';
+        feedback.style.color = '#166534';
+    } else {
+        feedback.textContent = '❌ As senhas não coincidem';
+        feedback.style.color = '#b53a4e';
+    }
+}
@@ -0,0 +1,147 @@
+function verDetalhes(pedidoId) {
+    // Detalhes são carregados sob demanda — a página não embute todos os pedidos
+    fetch(`/admin/pedido/${pedidoId}.json`)
+        .then(response => {
+            if (!response.ok) throw new Error('Erro ao buscar pedido');
+            return response.json();
+        })
+        .then(mostrarDetalhes)
+        .catch(error => {
+            console.error(error);
+            alert('Não foi possível carregar os detalhes do pedido.');
+        });
+}
+
+function escHtml(str) {
+    const d = document.createElement('div');
+    d.textContent = str == null ? '' : str;
+    return d.innerHTML;
+}
+
+function mostrarDetalhes(pedido) {
+    const modal = document.getElementById('modal');
+    const modalBody = document.getElementById('modal-body');
+
+    // Definir timeline de status
+    const statusFlow = ['Pendente', 'Confirmado', 'Producao', 'Concluido', 'Enviado', 'Entregue'];
+    const statusNames = {
+        'Pendente': '⏳ Pendente',
+        'Confirmado': '✓ Confirmado',
+        'Producao': '🔨 Em Produção',
+        'Concluido': '✅ Concluído',
+        'Enviado': '📦 Enviado',
+        'Entregue': '🎉 Entregue',
+        'Cancelado': '❌ Cancelado'
+    };
+
+    let timelineHTML = '';
+    if (pedido.status === 'Cancelado') {
+        timelineHTML = `<div class="timeline-item active">
+            <span class="timeline-icon">❌</span>
+            <span class="timeline-text">Pedido Cancelado</span>
+        </div>`;
+    } else {
+        const currentIndex = statusFlow.indexOf(pedido.status);
+        statusFlow.forEach((status, index) => {
+            let itemClass = '';
+            if (index < currentIndex) itemClass = 'completed';
+            else if (index === currentIndex) itemClass = 'active';
+
+            timelineHTML += `<div class="timeline-item ${itemClass}">
+                <span class="timeline-icon">${statusNames[status].split(' ')[0]}</span>
+                <span class="timeline-text">${statusNames[status].substring(2)}</span>
+            </div>`;
+        });
+    }
+
+    // Botões de ação baseado no status
+    let acoesHTML = '';
+    if (pedido.status === 'Pendente') {
+        acoesHTML = `<button class="btn-acao btn-confirmar" onclick="alterarStatusModal(${pedido.id}, 'Confirmado')">✓ Confirmar Pedido</button>`;
+    } else if (pedido.status === 'Confirmado') {
+        acoesHTML = `<button class="btn-acao btn-confirmar" onclick="alterarStatusModal(${pedido.id}, 'Producao')">🔨 Iniciar Produção</button>`;
+    } else if (pedido.status === 'Producao') {
+        acoesHTML = `<button class="btn-acao btn-confirmar" onclick="alterarStatusModal(${pedido.id}, 'Concluido')">✅ Marcar como Concluído</button>`;
+    } else if (pedido.status === 'Concluido') {
+        acoesHTML = `<button class="btn-acao btn-confirmar" onclick="alterarStatusModal(${pedido.id}, 'Enviado')">📦 Marcar como Enviado</button>`;
+    } else if (pedido.status === 'Enviado') {
+        acoesHTML = `<button class="btn-acao btn-confirmar" onclick="alterarStatusModal(${pedido.id}, 'Entregue')">🎉 Marcar como Entregue</button>`;
+    }
+
+    if (pedido.status !== 'Cancelado' && pedido.status !== 'Entregue') {
+        acoesHTML += `<button class="btn-acao btn-cancelar" onclick="alterarStatusModal(${pedido.id}, 'Cancelado')">❌ Cancelar Pedido</button>`;
+    }
+
+    modalBody.innerHTML = `
+        <div class="info-group">
+            <label>Pedido ID:</label>
+            <div class="value pedido-id">#${String(pedido.id).padStart(4, '0')}</div>
+        </div>
+        <div class="info-group">
+            <label>Data:</label>
+            <div class="value">${pedido.data_pedido}</div>
+        </div>
+
+        <div class="status-timeline">
+            <h3>Status do Pedido</h3>
+            ${timelineHTML}
+        </div>
+
+        <div class="info-group">
+            <label>Cliente:</label>
+            <div class="value">${escHtml(pedido.nome_cliente)}</div>
+        </div>
+        <div class="info-group">
+            <label>E-mail:</label>
+            <div class="value">${escHtml(pedido.email)}</div>
+        </div>
+        <div class="info-group">
+            <label>Telefone:</label>
+            <div class="value">${escHtml(pedido.telefone)}</div>
+        </div>
+        <div class="info-group">
+            <label>Endereço:</label>
+            <div class="value">${escHtml(pedido.endereco)}</div>
+        </div>
+        <div class="info-group">
+            <label>Produto:</label>
+            <div class="value">${escHtml(pedido.produto.nome)}</div>
+        </div>
+        <div class="info-group">
+            <label>Quantidade:</label>
+            <div class="value">${pedido.quantidade} unidade(s)</div>
+        </div>
+        <div class="info-group">
+            <label>Total:</label>
+            <div class="value" style="font-size: 1.5em; color: #b19cd9; font-weight: bold;">R$ ${pedido.total.toFixed(2).replace('.', ',')}</div>
+        </div>
+
+        <div class="acoes-modal">
+            ${acoesHTML}
+        </div>
+    `;
+
+    modal.classList.add('active');
+}
+
+function alterarStatusModal(pedidoId, novoStatus) {
+    fecharModal();
+    alterarStatus(pedidoId, novoStatus);
+}
+
+function fecharModal() {
+    document.getElementById('modal').classList.remove('active');
+}
+
+function alterarStatus(pedidoId, novoStatus) {
+    if (confirm(`Deseja alterar o status deste pedido para "${novoStatus}"?`)) {
+        window.location.href = `/admin/pedido/${pedidoId}/status/${novoStatus}`;
+    }
+}
+
+// Fechar modal clicando fora
+document.getElementById('modal').addEventListener('click', function(e) {
+    if (e.target === this) {
+        fecharModal();
+    }
+});
@@ -0,0 +1,175 @@
+function formatPrice(val) {
+    return 'R$ ' + val.toFixed(2).replace('.', ',');
+}
+
+// ── Render Cart ──
+function renderCart() {
+    const cart = getCart();
+    const container = document.getElementById('cart-items-container');
+    const summaryList = document.getElementById('summary-items-list');
+    const totalEl = document.getElementById('summary-total');
+    const btnCheckout = document.getElementById('btn-checkout');
+    const btnLimpar = document.getElementById('btn-limpar-all');
+    const subtitle = document.getElementById('cart-subtitle');
+    const title = document.getElementById('items-count-title');
+
+    updateNavBadge();
+
+    if (cart.length === 0) {
+        btnCheckout.disabled = true;
+        btnLimpar.style.display = 'none';
+        subtitle.textContent = 'Seu carrinho está vazio';
+        title.textContent = 'Nenhum item';
+
+        container.innerHTML = `
+            <div class="empty-cart">
+                <span class="empty-icon">🧶</span>
+                <h2>Carrinho vazio!</h2>
+                <p>Que tal explorar nossas peças artesanais?</p>
+                <a href="/produtos" class="btn-checkout" style="text-decoration:none; display:inline-block; width:auto; padding:14px 35px;">
+                    Ver Produtos
+                </a>
+            </div>`;
+
+        summaryList.innerHTML = '<p style="color:#9a8aaa; font-size:0.9em; text-align:center; padding:10px 0">Nenhum item no carrinho</p>';
+        totalEl.textContent = 'R$ 0,00';
+        return;
+    }
+
+    const itemCount = cart.reduce((s, i) => s + i.quantidade, 0);
+    const totalGeral = cart.reduce((s, i) => s + i.preco * i.quantidade, 0);
+
+    title.textContent = `${itemCount} ${itemCount === 1 ? 'item' : 'itens'}`;
+    subtitle.textContent = 'Revise seus itens antes de finalizar';
+    btnCheckout.disabled = false;
+    btnLimpar.style.display = 'block';
+
+    // Items
+    container.innerHTML = cart.map((item, idx) => `
+        <div class="cart-item" id="item-${item.id}">
+            <div class="item-img">
+                ${item.imagem_url
+                    ? `<img src="${item.imagem_url}" alt="${escHtml(item.nome)}">`
+                    : '🧶'}
+            </div>
+            <div class="item-details">
+                <div class="item-name">${escHtml(item.nome)}</div>
+                ${item.categoria ? `<div class="item-category">${escHtml(item.categoria)}</div>` : ''}
+                <div class="item-controls">
+                    <button class="qty-btn" onclick="alterarQtd(${item.id}, -1)" title="Diminuir">−</button>
+                    <span class="qty-display" id="qty-${item.id}">${item.quantidade}</span>
+                    <button class="qty-btn" onclick="alterarQtd(${item.id}, 1)" title="Aumentar">+</button>
+                </div>
+            </div>
+            <div class="item-right">
+                <div>
+                    <div class="item-price">${formatPrice(item.preco * item.quantidade)}</div>
+                    <div class="item-unit-price">${formatPrice(item.preco)} / un.</div>
+                </div>
+                <button class="btn-remover" onclick="removerItem(${item.id})" title="Remover">✕</button>
+            </div>
+        </div>
+    `).join('');
+
+    // Summary
+    summaryList.innerHTML = cart.map(item => `
+        <div class="summary-row">
+            <span>${escHtml(item.nome)} × ${item.quantidade}</span>
+            <span>${formatPrice(item.preco * item.quantidade)}</span>
+        </div>
+    `).join('');
+
+    totalEl.textContent = formatPrice(totalGeral);
+}
+
+function escHtml(str) {
+    const d = document.createElement('div');
+    d.textContent = str;
+    return d.innerHTML;
+}
+
+// ── Cart Actions ──
+function alterarQtd(produtoId, delta) {
+    const cart = getCart();
+    const idx = cart.findIndex(i => i.id == produtoId);
+    if (idx === -1) return;
+
+    cart[idx].quantidade += delta;
+    if (cart[idx].quantidade <= 0) {
+        cart.splice(idx, 1);
+    }
+
+    saveCart(cart);
+    renderCart();
+}
+
+function removerItem(produtoId) {
+    const cart = getCart().filter(i => i.id != produtoId);
+    saveCart(cart);
+
+    // Animate removal
+    const el = document.getElementById(`item-${produtoId}`);
+    if (el) {
+        el.style.transition = 'all 0.3s ease';
+        el.style.opacity = '0';
+        el.style.transform = 'translateX(30px)';
+        setTimeout(() => renderCart(), 300);
+    } else {
+        renderCart();
+    }
+}
+
+function limparCarrinho() {
+    if (confirm('Deseja realmente limpar todo o carrinho?')) {
+        saveCart([]);
+        renderCart();
+    }
+}
+
+// ── Checkout ──
+let checkoutQueue = [];
+
+function irParaCheckout() {
+    const cart = getCart();
+    if (cart.length === 0) return;
+
+    if (cart.length === 1) {
+        // Single item: go directly
+        const item = cart[0];
+        window.location.href = `/finalizar-compra?produto_id=${item.id}&quantidade=${item.quantidade}`;
+    } else {
+        // Multiple items: show modal
+        checkoutQueue = [...cart];
+        const modal = document.getElementById('checkoutModal');
+        const countEl = document.getElementById('modal-items-count');
+        const listEl = document.getElementById('modal-items-list');
+
+        countEl.textContent = cart.length;
+        listEl.innerHTML = cart.map(item => `
+            <div class="modal-item">
+                <span>${escHtml(item.nome)} × ${item.quantidade}</span>
+                <span>${formatPrice(item.preco * item.quantidade)}</span>
+            </div>
+        `).join('');
+
+        modal.classList.add('active');
+    }
+}
+
+function fecharModal() {
+    document.getElementById('checkoutModal').classList.remove('active');
+}
+
+function confirmarCheckout() {
+    fecharModal();
+    if (checkoutQueue.length === 0) return;
+    window.location.href = '/finalizar-compra/carrinho';
+}
+
+// Close modal on backdrop click
+document.getElementById('checkoutModal').addEventListener('click', function(e) {
+    if (e.target === this) fecharModal();
+});
+
+// ── Init ──
+renderCart();
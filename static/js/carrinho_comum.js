@@ -0,0 +1,20 @@
+// Carrinho guardado no localStorage — usado por todas as páginas da loja
+function getCart() {
+    try { return JSON.parse(localStorage.getItem('croche_cart') || '[]'); }
+    catch { return []; }
+}
+
+function saveCart(cart) {
+    localStorage.setItem('croche_cart', JSON.stringify(cart));
+    updateNavBadge();
+}
+
+function updateNavBadge() {
+    const cart = getCart();
+    const total = cart.reduce((s, i) => s + i.quantidade, 0);
+    const badge = document.getElementById('navCartCount');
+    if (badge) {
+        badge.textContent = total;
+        badge.style.display = total > 0 ? 'flex' : 'none';
+    }
+}
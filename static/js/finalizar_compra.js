@@ -0,0 +1,66 @@
+// Carregar dados do produto via URL
+window.addEventListener('DOMContentLoaded', function() {
+    const urlParams = new URLSearchParams(window.location.search);
+    const produtoId = urlParams.get('produto_id');
+    const quantidade = urlParams.get('quantidade') || 1;
+
+    console.log('Produto ID:', produtoId);
+    console.log('Quantidade:', quantidade);
+
+    if (!produtoId) {
+        alert('Nenhum produto selecionado! Redirecionando...');
+        window.location.href = '/produtos';
+        return;
+    }
+
+    // Atualizar campos hidden
+    document.getElementById('hidden_produto_id').value = produtoId;
+    document.getElementById('hidden_quantidade').value = quantidade;
+    document.getElementById('produto-quantidade').textContent = quantidade;
+
+    // Buscar informações do produto (só o produto do checkout, não o catálogo inteiro)
+    fetch(`/api/produtos/${encodeURIComponent(produtoId)}?campos=nome,preco`)
+        .then(response => {
+            if (response.status === 404) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error('Erro ao buscar produto');
+            }
+            return response.json();
+        })
+        .then(produto => {
+            if (produto) {
+                const subtotal = produto.preco * quantidade;
+                document.getElementById('produto-nome').textContent = produto.nome;
+                document.getElementById('subtotal').textContent = `R$ ${subtotal.toFixed(2).replace('.', ',')}`;
+                document.getElementById('total').textContent = `R$ ${subtotal.toFixed(2).replace('.', ',')}`;
+            } else {
+                alert('Produto não encontrado!');
+                window.location.href = '/produtos';
+            }
+        })
+        .catch(error => {
+            console.error('Erro ao carregar produto:', error);
+            alert('Erro ao carregar produto! Verifique sua conexão.');
+            document.getElementById('produto-nome').textContent = 'Erro ao carregar';
+        });
+});
+
+// Adicionar loading no botão ao enviar
+document.getElementById('formCheckout').addEventListener('submit', function(e) {
+    const btn = document.getElementById('btnSubmit');
+
+    // Verificar se os campos hidden estão preenchidos
+    const produtoId = document.getElementById('hidden_produto_id').value;
+    const quantidade = document.getElementById('hidden_quantidade').value;
+
+    if (!produtoId || !quantidade) {
+        e.preventDefault();
+        alert('Erro: Produto não identificado. Tente novamente.');
+        return false;
+    }
+
+    btn.textContent = '⏳ Processando...';
+    btn.disabled = true;
+});
@@ -0,0 +1,42 @@
+// Checkout do carrinho: o servidor recalcula preços e total, aqui é só o resumo
+window.addEventListener('DOMContentLoaded', function() {
+    let cart = [];
+    try { cart = JSON.parse(localStorage.getItem('croche_cart') || '[]'); } catch { cart = []; }
+
+    if (cart.length === 0) {
+        alert('Seu carrinho está vazio! Redirecionando...');
+        window.location.href = '/produtos';
+        return;
+    }
+
+    document.getElementById('hidden_itens').value = JSON.stringify(
+        cart.map(i => ({ id: i.id, quantidade: i.quantidade }))
+    );
+
+    const formatar = v => `R$ ${v.toFixed(2).replace('.', ',')}`;
+    const lista = document.getElementById('resumo-itens-carrinho');
+    cart.forEach(item => {
+        const linha = document.createElement('div');
+        linha.className = 'resumo-item';
+        const nome = document.createElement('span');
+        nome.textContent = `${item.nome} × ${item.quantidade}`;
+        const valor = document.createElement('span');
+        valor.textContent = formatar(item.preco * item.quantidade);
+        linha.append(nome, valor);
+        lista.appendChild(linha);
+    });
+    const total = cart.reduce((s, i) => s + i.preco * i.quantidade, 0);
+    document.getElementById('total').textContent = formatar(total);
+});
+
+document.getElementById('formCheckout').addEventListener('submit', function(e) {
+    if (!document.getElementById('hidden_itens').value) {
+        e.preventDefault();
+        alert('Erro: carrinho vazio. Tente novamente.');
+        return false;
+    }
+    sessionStorage.setItem('croche_checkout_carrinho', '1');
+    const btn = document.getElementById('btnSubmit');
+    btn.textContent = '⏳ Processando...';
+    btn.disabled = true;
+});
@@ -0,0 +1,17 @@
+setTimeout(() => {
+    document.getElementById('waPopup').classList.add('open');
+}, 4000);
+
+function toggleWa() {
+    document.getElementById('waPopup').classList.toggle('open');
+}
+
+document.addEventListener('click', function(e) {
+    const popup = document.getElementById('waPopup');
+    const btn   = document.getElementById('waBtn');
+    if (popup.classList.contains('open') && !popup.contains(e.target) && !btn.contains(e.target)) {
+        popup.classList.remove('open');
+    }
+});
+
+updateNavBadge();
@@ -0,0 +1,5 @@
+// Pedido veio do carrinho e foi pago — esvazia o carrinho
+if (sessionStorage.getItem('croche_checkout_carrinho')) {
+    localStorage.removeItem('croche_cart');
+    sessionStorage.removeItem('croche_checkout_carrinho');
+}
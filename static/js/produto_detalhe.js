@@ -0,0 +1,44 @@
+function aumentar() {
+    const input = document.getElementById('quantidade');
+    const atual = parseInt(input.value);
+    if (atual < 99) input.value = atual + 1;
+}
+
+function diminuir() {
+    const input = document.getElementById('quantidade');
+    const atual = parseInt(input.value);
+    if (atual > 1) input.value = atual - 1;
+}
+
+function comprar() {
+    const quantidade = document.getElementById('quantidade').value;
+    window.location.href = `/finalizar-compra?produto_id=${produtoId}&quantidade=${quantidade}`;
+}
+
+function adicionarCarrinho() {
+    const quantidade = parseInt(document.getElementById('quantidade').value);
+    const cart = getCart();
+    const existing = cart.find(i => i.id == produtoId);
+
+    if (existing) {
+        existing.quantidade += quantidade;
+    } else {
+        cart.push({
+            id: produtoId,
+            nome: produtoNome,
+            preco: produtoPreco,
+            quantidade: quantidade,
+            categoria: produtoCategoria,
+            imagem_url: produtoImagem
+        });
+    }
+
+    saveCart(cart);
+
+    // Feedback visual
+    const feedback = document.getElementById('cart-feedback');
+    feedback.style.display = 'block';
+    setTimeout(() => { feedback.style.display = 'none'; }, 3000);
+}
+
+updateNavBadge();
@@ -0,0 +1,73 @@
+function addToCart(id, nome, preco, categoria, imagem_url) {
+    const cart = getCart();
+    const existing = cart.find(i => i.id == id);
+    if (existing) {
+        existing.quantidade += 1;
+    } else {
+        cart.push({ id, nome, preco, quantidade: 1, categoria, imagem_url });
+    }
+    saveCart(cart);
+
+    const toast = document.getElementById('toast');
+    toast.textContent = `✅ "${nome}" adicionado!`;
+    toast.classList.add('show');
+    setTimeout(() => toast.classList.remove('show'), 2500);
+}
+
+updateNavBadge();
+
+// Rolagem infinita: busca a próxima página (cursor) quando o fim da grade se aproxima.
+// Sem JS (ou sem IntersectionObserver) fica o link "Carregar mais".
+const maisProdutos = document.getElementById('maisProdutos');
+if (maisProdutos && 'IntersectionObserver' in window) {
+    let carregando = false;
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries[0].isIntersecting) {
+            carregarMaisProdutos();
+        }
+    }, { rootMargin: '600px' });
+    observer.observe(maisProdutos);
+
+    function carregarMaisProdutos() {
+        if (carregando || !maisProdutos.dataset.cursor) {
+            return;
+        }
+        carregando = true;
+
+        const url = new URL(maisProdutos.dataset.url, window.location.origin);
+        url.searchParams.set('cursor', maisProdutos.dataset.cursor);
+
+        fetch(url)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Erro ao carregar produtos');
+                }
+                return response.json();
+            })
+            .then(pagina => {
+                const temporario = document.createElement('div');
+                temporario.innerHTML = pagina.html;
+                const grade = document.querySelector('.produtos-grid');
+                temporario.querySelectorAll('.produto-card').forEach(card => grade.appendChild(card));
+
+                if (pagina.proximo_cursor) {
+                    maisProdutos.dataset.cursor = pagina.proximo_cursor;
+                    const link = maisProdutos.querySelector('a');
+                    const proxima = new URL(link.href);
+                    proxima.searchParams.set('cursor', pagina.proximo_cursor);
+                    link.href = proxima;
+                    // Se o fim da grade continua visível, o observer só dispara de novo se for reiniciado
+                    observer.unobserve(maisProdutos);
+                    observer.observe(maisProdutos);
+                } else {
+                    observer.disconnect();
+                    maisProdutos.remove();
+                }
+            })
+            .catch(error => console.error('Erro ao carregar mais produtos:', error))
+            .finally(() => {
+                carregando = false;
+            });
+    }
+}